@@ -0,0 +1,152 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from config import (AGENT_LLM_CACHE, AGENT_MODEL, AGENT_PROMPT,
+                    AGENT_SYSTEM_MESSAGE, MEMORY_SUMMARY_MODEL,
+                    MEMORY_TOKEN_BUDGET, VERBOSE)
+from services.prompt_cache import pull_prompt
+
+# Tags the agent's own model calls so streaming skips other model calls
+AGENT_LLM_TAG = "agent_llm"
+
+
+def get_tools():
+    """Return the tools that the agent can use."""
+    from tools import (datetime_tool, gmail_email_body_tool, hashtag_tool,
+                       news_digest_tool, news_tool, search_gmail_combined_tool)
+
+    return [
+        datetime_tool,
+        search_gmail_combined_tool,
+        gmail_email_body_tool,
+        news_tool,
+        news_digest_tool,
+        hashtag_tool,
+    ]
+
+
+def with_system_message(prompt, system_message: str):
+    """Return ``prompt`` with its system message replaced by ``system_message``."""
+    from langchain_core.messages import SystemMessage
+    from langchain_core.prompts import (ChatPromptTemplate,
+                                        SystemMessagePromptTemplate)
+
+    messages = [
+        message
+        for message in prompt.messages
+        if not isinstance(message, (SystemMessage, SystemMessagePromptTemplate))
+    ]
+    # A literal message, so braces in the text are not template variables
+    return ChatPromptTemplate.from_messages(
+        [SystemMessage(content=system_message)] + messages
+    )
+
+
+@dataclass
+class SharedAgent:
+    """The model, prompt and tools shared by every conversation."""
+
+    agent: Any
+    tools: List[Any]
+    summary_llm: Any
+    verbose: bool = VERBOSE
+
+    def new_executor(self):
+        """Return an executor with its own memory for one conversation."""
+        from langchain.agents import AgentExecutor
+
+        from services.conversation_memory import BudgetedWindowMemory
+
+        # Keep recent turns verbatim and summarize older ones in the
+        # background; the executor saves each turn, the prompt reads
+        # chat_history
+        memory = BudgetedWindowMemory(
+            llm=self.summary_llm,
+            max_token_limit=MEMORY_TOKEN_BUDGET,
+            input_key="input",
+            output_key="output",
+        )
+        return AgentExecutor.from_agent_and_tools(
+            agent=self.agent,
+            tools=self.tools,
+            verbose=self.verbose,
+            memory=memory,
+            handle_parsing_errors=True,
+        )
+
+
+def build_shared_agent(timings: Optional[Dict[str, float]] = None) -> SharedAgent:
+    """Build the tool-calling agent shared by every conversation.
+
+    LangChain is imported here rather than at module level, so callers can
+    show a prompt first and build the agent in the background. Tools the
+    model calls in the same step run concurrently under ``ainvoke`` and
+    ``astream_events``. The seconds spent importing LangChain, loading the
+    tools, loading the prompt and creating the agent are recorded in
+    ``timings`` when it is given.
+    """
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+
+    def lap(phase):
+        nonlocal start
+        now = time.perf_counter()
+        timings[phase] = now - start
+        start = now
+
+    from langchain.agents import create_tool_calling_agent
+    from langchain_openai import ChatOpenAI
+
+    from services.openai_client import langchain_client_kwargs
+
+    lap("langchain imports")
+
+    tools = get_tools()
+    lap("tools")
+
+    # Load the JSON Chat Prompt, from the local cache after the first pull
+    prompt = with_system_message(pull_prompt(AGENT_PROMPT), AGENT_SYSTEM_MESSAGE)
+    lap("prompt")
+
+    # Initialize a ChatOpenAI model
+    cache = None
+    if AGENT_LLM_CACHE:
+        from services.completion_cache import (LangChainCompletionCache,
+                                               get_completion_cache)
+
+        cache = LangChainCompletionCache(get_completion_cache())
+    llm = ChatOpenAI(
+        model=AGENT_MODEL,
+        tags=[AGENT_LLM_TAG],
+        cache=cache,
+        **langchain_client_kwargs(),
+    )
+
+    # Create a tool-calling Agent
+    agent = create_tool_calling_agent(llm=llm, tools=tools, prompt=prompt)
+    summary_llm = ChatOpenAI(model=MEMORY_SUMMARY_MODEL, **langchain_client_kwargs())
+    shared_agent = SharedAgent(agent=agent, tools=tools, summary_llm=summary_llm)
+    lap("agent")
+    return shared_agent
+
+
+def build_agent_executor(timings: Optional[Dict[str, float]] = None):
+    """Build the agent with memory for a single conversation."""
+    return build_shared_agent(timings).new_executor()
+
+
+async def astream_answer(agent_executor, user_input: str):
+    """Yield the agent's answer to ``user_input`` as the model generates it.
+
+    Only text from the agent's own model is yielded; tool calls and the
+    memory's summary calls stay off the screen.
+    """
+    events = agent_executor.astream_events({"input": user_input}, version="v2")
+    async for event in events:
+        if event["event"] == "on_chat_model_stream" and AGENT_LLM_TAG in event.get(
+            "tags", []
+        ):
+            content = event["data"]["chunk"].content
+            if content:
+                yield content
@@ -0,0 +1,93 @@
+"""Compare the single-pass cleaner with the previous BeautifulSoup implementation.
+
+Run from the repository root:
+
+    python -m benchmarks.email_cleaner_benchmark
+"""
+
+import random
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+from services.email_cleaner import clean_email_bodies, clean_email_body
+
+CORPUS_SIZE = 2000
+
+WORDS = (
+    "order shipped delivery invoice weekly digest update product launch offer "
+    "subscribe unsubscribe account security travel booking flight hotel train "
+    "newsletter community event webinar article reading list"
+).split()
+
+
+def legacy_clean_email_body(body: str) -> str:
+    """The BeautifulSoup cleaner this module replaced, kept for comparison."""
+    soup = BeautifulSoup(body, "html.parser")
+    for script in soup(["script", "style"]):
+        script.decompose()
+    signature = soup.find("div", class_="signature")
+    if signature:
+        signature.decompose()
+    text = soup.get_text()
+    text = re.sub(r"\n+", "\n", text)
+    text = re.sub(r"\r+", "\r", text)
+    text = re.sub(r"\s+", " ", text)
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    text = "\n".join(chunk for chunk in chunks if chunk)
+    text = re.sub(r"[^\x20-\x7E\n]", "", text)
+    return text.strip()
+
+
+def _sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize()
+
+
+def newsletter(rng):
+    """Build a table-heavy HTML newsletter similar to typical marketing mail."""
+    rows = "".join(
+        f"<tr><td class='item'><h2>{_sentence(rng)}</h2>"
+        f"<p>{_sentence(rng)} &amp; {_sentence(rng)}&nbsp;&mdash; "
+        f"<a href='https://example.com/{i}'>Read more</a></p></td></tr>\n"
+        for i in range(rng.randint(5, 30))
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Weekly digest</title>"
+        "<style>td { padding: 4px; } .item h2 { font-size: 18px; }</style>"
+        "<script>var tracking = {id: 42};</script></head><body>"
+        f"<table>{rows}</table>"
+        "<div class='signature'><p>The Newsletter Team</p></div>"
+        "<div class='footer'><p>You are receiving this email because you "
+        "subscribed. <a href='#'>Unsubscribe</a></p></div></body></html>"
+    )
+
+
+def _time(fn, corpus):
+    start = time.perf_counter()
+    result = fn(corpus)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    rng = random.Random(0)
+    corpus = [newsletter(rng) for _ in range(CORPUS_SIZE)]
+    size_mb = sum(len(body) for body in corpus) / 1e6
+
+    legacy, legacy_time = _time(
+        lambda bodies: [legacy_clean_email_body(body) for body in bodies], corpus
+    )
+    single, single_time = _time(
+        lambda bodies: [clean_email_body(body) for body in bodies], corpus
+    )
+    clean_email_bodies(corpus[:100])  # start the worker processes
+    pooled, pooled_time = _time(clean_email_bodies, corpus)
+
+    mismatches = sum(old != new for old, new in zip(legacy, single))
+    assert single == pooled
+    print(f"Corpus:          {CORPUS_SIZE} newsletters, {size_mb:.1f} MB")
+    print(f"BeautifulSoup:   {legacy_time:.2f}s")
+    print(f"Single pass:     {single_time:.2f}s ({legacy_time / single_time:.1f}x)")
+    print(f"Process pool:    {pooled_time:.2f}s ({legacy_time / pooled_time:.1f}x)")
+    print(f"Output mismatches vs BeautifulSoup: {mismatches}")
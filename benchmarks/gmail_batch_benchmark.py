@@ -0,0 +1,35 @@
+"""Compare sequential and batched message retrieval against a stubbed Gmail API.
+
+Run from the repository root:
+
+    python -m benchmarks.gmail_batch_benchmark
+"""
+
+import time
+
+from benchmarks.gmail_stub import StubGmailService
+from services import gmail_search
+
+TOTAL_MESSAGES = 200
+
+
+def _run(batched):
+    start = time.perf_counter()
+    emails = gmail_search.search_gmail_service(
+        "label:inbox", max_results=TOTAL_MESSAGES, batched=batched
+    )
+    return emails, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    stub = StubGmailService(total=TOTAL_MESSAGES)
+    gmail_search._authenticate_gmail = lambda: stub
+
+    sequential, sequential_time = _run(batched=False)
+    batched, batched_time = _run(batched=True)
+
+    assert sequential == batched, "batched fetch returned different emails"
+    print(f"Messages:   {len(batched)}")
+    print(f"Sequential: {sequential_time:.2f}s")
+    print(f"Batched:    {batched_time:.2f}s")
+    print(f"Speedup:    {sequential_time / batched_time:.1f}x")
@@ -0,0 +1,105 @@
+"""In-process stand-in for the Gmail API used by the benchmarks."""
+
+import base64
+import time
+
+LATENCY = 0.05
+
+
+class _Request:
+    def __init__(self, fn, latency):
+        self._fn = fn
+        self._latency = latency
+
+    def execute(self):
+        time.sleep(self._latency)
+        return self._fn()
+
+
+class _Batch:
+    def __init__(self, callback, latency):
+        self._callback = callback
+        self._latency = latency
+        self._requests = []
+
+    def add(self, request, request_id=None):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        # A batch costs a single round trip regardless of its size
+        time.sleep(self._latency)
+        for request_id, request in self._requests:
+            self._callback(request_id, request._fn(), None)
+
+
+class _Messages:
+    def __init__(self, stub):
+        self._stub = stub
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None):
+        start = int(pageToken or 0)
+        end = min(start + maxResults, self._stub.total)
+        ids = [{"id": f"msg{i}"} for i in range(start, end)]
+
+        def result():
+            page = {"messages": ids}
+            if end < self._stub.total:
+                page["nextPageToken"] = str(end)
+            return page
+
+        return _Request(result, self._stub.latency)
+
+    def get(self, userId, id, format="full", metadataHeaders=None):
+        return _Request(lambda: self._stub.message(id), self._stub.latency)
+
+
+class _Labels:
+    def __init__(self, stub):
+        self._stub = stub
+
+    def list(self, userId):
+        labels = [{"id": "INBOX", "name": "INBOX"}, {"id": "L1", "name": "orders"}]
+        return _Request(lambda: {"labels": labels}, self._stub.latency)
+
+
+class _Users:
+    def __init__(self, stub):
+        self._stub = stub
+
+    def messages(self):
+        return _Messages(self._stub)
+
+    def labels(self):
+        return _Labels(self._stub)
+
+
+class StubGmailService:
+    """Serves ``total`` synthetic messages with a fixed per-round-trip latency."""
+
+    def __init__(self, total=200, latency=LATENCY):
+        self.total = total
+        self.latency = latency
+
+    def users(self):
+        return _Users(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(callback, self.latency)
+
+    def message(self, msg_id):
+        html = f"<html><body><p>Order {msg_id} has shipped.</p></body></html>"
+        data = base64.urlsafe_b64encode(html.encode("utf-8")).decode("ascii")
+        return {
+            "id": msg_id,
+            "threadId": msg_id,
+            "internalDate": "1700000000000",
+            "labelIds": ["INBOX", "L1"],
+            "payload": {
+                "mimeType": "text/html",
+                "headers": [
+                    {"name": "Subject", "value": f"Your order {msg_id}"},
+                    {"name": "From", "value": "Shop <orders@example.com>"},
+                ],
+                "body": {"data": data},
+            },
+        }
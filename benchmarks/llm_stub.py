@@ -0,0 +1,87 @@
+"""In-process stand-in for the agent's chat model used by the benchmarks."""
+
+import asyncio
+import json
+import time
+from typing import Any, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (AIMessage, AIMessageChunk, HumanMessage,
+                                     ToolMessage)
+from langchain_core.outputs import (ChatGeneration, ChatGenerationChunk,
+                                    ChatResult)
+
+FIRST_TOKEN_LATENCY = 0.3
+TOKEN_LATENCY = 0.01
+ANSWER = "Your order has shipped and should arrive later this week."
+
+
+class StubChatModel(BaseChatModel):
+    """Calls ``tool_name`` once per question, then streams a fixed answer.
+
+    Every call waits ``first_token_latency`` before its first chunk and
+    ``token_latency`` between answer words, like a hosted model would.
+    """
+
+    tool_name: str = ""
+    tool_args: dict = {}
+    first_token_latency: float = FIRST_TOKEN_LATENCY
+    token_latency: float = TOKEN_LATENCY
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def bind_tools(self, tools: List[Any], **kwargs: Any):
+        return self
+
+    def _reply(self, messages) -> AIMessage:
+        # Only the messages after the latest question belong to this turn
+        last_question = max(
+            i for i, message in enumerate(messages) if isinstance(message, HumanMessage)
+        )
+        used_tool = any(
+            isinstance(message, ToolMessage) for message in messages[last_question:]
+        )
+        if self.tool_name and not used_tool:
+            tool_call = {
+                "name": self.tool_name,
+                "args": self.tool_args,
+                "id": f"call_{time.monotonic_ns()}",
+            }
+            return AIMessage(content="", tool_calls=[tool_call])
+        return AIMessage(content=ANSWER)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_latency)
+        reply = self._reply(messages)
+        if reply.tool_calls:
+            tool_call_chunks = [
+                {
+                    "name": tool_call["name"],
+                    "args": json.dumps(tool_call["args"]),
+                    "id": tool_call["id"],
+                    "index": index,
+                }
+                for index, tool_call in enumerate(reply.tool_calls)
+            ]
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(content="", tool_call_chunks=tool_call_chunks)
+            )
+            return
+        for index, word in enumerate(reply.content.split(" ")):
+            if index:
+                await asyncio.sleep(self.token_latency)
+                word = " " + word
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word))
+            if run_manager:
+                await run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
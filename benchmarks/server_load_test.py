@@ -0,0 +1,141 @@
+"""Load-test the chat server against stubbed model and Gmail backends.
+
+Run from the repository root:
+
+    python -m benchmarks.server_load_test
+
+The server from server.py runs in-process on a local port with a stub
+chat model that calls the live Gmail search tool once per question, and
+a stub Gmail API behind that tool. Each simulated user keeps one session
+and asks its questions one after another over HTTP; a second pass
+measures time to first token over the WebSocket endpoint. Memory counts
+tokens in words instead of tiktoken tokens, so the test runs offline.
+"""
+
+import asyncio
+import time
+
+import httpx
+import uvicorn
+import websockets
+from langchain.agents import create_tool_calling_agent
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from agent import AGENT_LLM_TAG, SharedAgent
+from benchmarks.gmail_stub import StubGmailService
+from benchmarks.llm_stub import StubChatModel
+from server import create_app
+from services import conversation_memory, gmail_search
+from tools import search_gmail_live_tool
+
+PORT = 8765
+USERS = [1, 8, 32]
+QUESTIONS_PER_USER = 5
+
+
+def _shared_agent():
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", "You are a helpful assistant"),
+            MessagesPlaceholder("chat_history", optional=True),
+            ("human", "{input}"),
+            MessagesPlaceholder("agent_scratchpad"),
+        ]
+    )
+    llm = StubChatModel(
+        tool_name=search_gmail_live_tool.name,
+        tool_args={"query": "label:inbox order"},
+        tags=[AGENT_LLM_TAG],
+    )
+    tools = [search_gmail_live_tool]
+    return SharedAgent(
+        agent=create_tool_calling_agent(llm=llm, tools=tools, prompt=prompt),
+        tools=tools,
+        summary_llm=FakeListChatModel(responses=["Earlier questions about orders."]),
+        verbose=False,
+    )
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def _http_user(client, latencies):
+    session_id = None
+    for question in range(QUESTIONS_PER_USER):
+        start = time.perf_counter()
+        response = await client.post(
+            "/chat",
+            json={"message": f"Where is order {question}?", "session_id": session_id},
+        )
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        session_id = response.json()["session_id"]
+
+
+async def _ws_user(first_tokens):
+    async with websockets.connect(f"ws://127.0.0.1:{PORT}/ws") as websocket:
+        await websocket.recv()  # session id
+        for question in range(QUESTIONS_PER_USER):
+            start = time.perf_counter()
+            await websocket.send(f"Where is order {question}?")
+            first = None
+            while True:
+                event = await websocket.recv()
+                if first is None and '"token"' in event:
+                    first = time.perf_counter() - start
+                if '"end"' in event or '"error"' in event:
+                    break
+            # Turns that failed before their first token have no time to report
+            if first is not None:
+                first_tokens.append(first)
+
+
+async def _run():
+    config = uvicorn.Config(
+        create_app(_shared_agent()), host="127.0.0.1", port=PORT, log_level="warning"
+    )
+    server = uvicorn.Server(config)
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    print(
+        f"{'users':>6}{'requests':>10}{'req/s':>8}{'p50 ms':>9}{'p99 ms':>9}"
+        f"{'ws ttft p50':>13}{'ws ttft p99':>13}"
+    )
+    limits = httpx.Limits(max_connections=max(USERS))
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=60
+    ) as client:
+        for users in USERS:
+            latencies = []
+            start = time.perf_counter()
+            await asyncio.gather(*[_http_user(client, latencies) for _ in range(users)])
+            elapsed = time.perf_counter() - start
+
+            first_tokens = []
+            await asyncio.gather(*[_ws_user(first_tokens) for _ in range(users)])
+
+            print(
+                f"{users:>6}{len(latencies):>10}{len(latencies) / elapsed:>8.1f}"
+                f"{_percentile(latencies, 0.5) * 1000:>9.0f}"
+                f"{_percentile(latencies, 0.99) * 1000:>9.0f}"
+                f"{_percentile(first_tokens, 0.5) * 1000:>13.0f}"
+                f"{_percentile(first_tokens, 0.99) * 1000:>13.0f}"
+            )
+
+    server.should_exit = True
+    await serve
+
+
+if __name__ == "__main__":
+    stub = StubGmailService(total=50)
+    gmail_search._authenticate_gmail = lambda: stub
+    # tiktoken downloads its encoding on first use
+    conversation_memory.count_tokens = lambda text: len(text.split())
+    asyncio.run(_run())
@@ -0,0 +1,154 @@
+"""Compare load time, query latency and footprint of the vector backends.
+
+Run from the repository root:
+
+    python -m benchmarks.vector_backend_benchmark
+
+Each backend is filled with the same synthetic unit vectors and then opened
+and queried in a fresh process, so load time and resident memory are not
+skewed by what the parent already has mapped. "month ms" is the median
+latency of the same queries restricted to the last month of a year of chunks.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from services.email_metadata import MetadataFilter
+from services.vector_backends import ChromaBackend, MmapBackend
+
+N_CHUNKS = 20_000
+DIM = 1536
+N_QUERIES = 50
+K = 3
+BATCH = 1000
+# Chunks are spread over a year; the filtered queries ask for the last month
+EPOCH_START = 1_700_000_000
+YEAR = 365 * 86400
+LAST_MONTH = MetadataFilter(after=EPOCH_START + YEAR - 30 * 86400)
+
+BACKENDS = {
+    "chroma": lambda directory: ChromaBackend(directory, None),
+    "mmap-float16": lambda directory: MmapBackend(directory, None, dtype="float16"),
+    "mmap-int8": lambda directory: MmapBackend(directory, None, dtype="int8"),
+}
+
+
+def _vectors():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((N_CHUNKS, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Queries are noisy copies of stored chunks so they have real neighbours
+    targets = rng.choice(N_CHUNKS, N_QUERIES, replace=False)
+    queries = vectors[targets] + 0.02 * rng.standard_normal((N_QUERIES, DIM))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries.astype(np.float32)
+
+
+def _fill(name, directory, vectors):
+    store = BACKENDS[name](directory)
+    for start in range(0, N_CHUNKS, BATCH):
+        ids = [f"m{i}:0:x" for i in range(start, min(start + BATCH, N_CHUNKS))]
+        store.upsert(
+            ids,
+            [f"chunk {chunk_id}" for chunk_id in ids],
+            [
+                {
+                    "id": chunk_id.split(":")[0],
+                    "epoch": EPOCH_START
+                    + int(chunk_id[1:].split(":")[0]) * YEAR // N_CHUNKS,
+                }
+                for chunk_id in ids
+            ],
+            vectors[start : start + BATCH].tolist(),
+        )
+
+
+def _rss_mb():
+    # Current rather than peak RSS: imports dominate the peak
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def _measure(name, directory, queries, results):
+    baseline = _rss_mb()
+    start = time.perf_counter()
+    store = BACKENDS[name](directory)
+    store.search_vector(queries[0].tolist(), K, -1.0)
+    load_time = time.perf_counter() - start
+
+    latencies, top_ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.search_vector(query.tolist(), K, -1.0)
+        latencies.append(time.perf_counter() - start)
+        top_ids.append([metadata["id"] for _, metadata, _ in hits])
+
+    filtered = []
+    for query in queries:
+        start = time.perf_counter()
+        store.search_vector(query.tolist(), K, -1.0, LAST_MONTH)
+        filtered.append(time.perf_counter() - start)
+
+    results[name] = {
+        "load_s": load_time,
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+        "filtered_ms": 1000 * float(np.percentile(filtered, 50)),
+        "rss_mb": _rss_mb() - baseline,
+        "top_ids": top_ids,
+    }
+
+
+def _disk_mb(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / 1e6
+
+
+if __name__ == "__main__":
+    vectors, queries = _vectors()
+    top = np.argsort(-(queries @ vectors.T), axis=1)[:, :K]
+    exact = [[f"m{i}" for i in row] for row in top]
+    workdir = tempfile.mkdtemp(prefix="vector-backends-")
+    context = multiprocessing.get_context("spawn")
+    results = context.Manager().dict()
+
+    print(f"{N_CHUNKS} chunks x {DIM} dims, {N_QUERIES} queries, k={K}\n")
+    print(
+        f"{'backend':<14}{'build s':>9}{'load s':>9}{'p50 ms':>9}{'p99 ms':>9}"
+        f"{'month ms':>9}{'disk MB':>9}{'RSS MB':>9}{'recall':>8}"
+    )
+    try:
+        for name in BACKENDS:
+            directory = os.path.join(workdir, name)
+            start = time.perf_counter()
+            _fill(name, directory, vectors)
+            build_time = time.perf_counter() - start
+
+            process = context.Process(
+                target=_measure, args=(name, directory, queries, results)
+            )
+            process.start()
+            process.join()
+
+            stats = results[name]
+            recall = np.mean(
+                [
+                    len(set(found) & set(expected)) / K
+                    for found, expected in zip(stats["top_ids"], exact)
+                ]
+            )
+            print(
+                f"{name:<14}{build_time:>9.1f}{stats['load_s']:>9.2f}"
+                f"{stats['p50_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+                f"{stats['filtered_ms']:>9.2f}"
+                f"{_disk_mb(directory):>9.1f}{stats['rss_mb']:>9.1f}{recall:>8.2f}"
+            )
+    finally:
+        shutil.rmtree(workdir)
@@ -2,7 +2,14 @@ import os
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 json_file_path = os.path.join(current_dir, "rag", "data", "emails.json")
+jsonl_file_path = os.path.join(current_dir, "rag", "data", "emails.jsonl")
 persistent_directory = os.path.join(current_dir, "rag", "db", "chroma_db")
+mmap_directory = os.path.join(current_dir, "rag", "db", "mmap_db")
+lexical_index_path = os.path.join(current_dir, "rag", "db", "lexical_index.json")
+embedding_cache_path = os.path.join(current_dir, "rag", "cache", "embeddings.sqlite")
+prompt_cache_directory = os.path.join(current_dir, "rag", "cache", "prompts")
+completion_cache_path = os.path.join(current_dir, "rag", "cache", "completions.sqlite")
+image_cache_directory = os.path.join(current_dir, "rag", "cache", "images")
 
 EMAIL_LABELS = [
     "label:inbox",
@@ -22,7 +29,100 @@ EMAIL_LABELS = [
 ]
 
 MAX_RESULTS = 2000
+GMAIL_BATCH_SIZE = 50
+GMAIL_MAX_RETRIES = 5
+GMAIL_BACKOFF_BASE = 1.0
+LABEL_CACHE_TTL = 3600
+CLEANER_PROCESSES = os.cpu_count() or 1
+CLEANER_POOL_MIN_BATCH = 50
+BODY_CACHE_SIZE = 256
+LIVE_SEARCH_HYDRATE_TOP = 1
+GMAIL_HEDGE_DELAY = 0.5
+RAG_SEARCH_DEADLINE = 5
+LIVE_SEARCH_DEADLINE = 20
 EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+EMBEDDING_BATCH_MAX_TOKENS = 50_000
+EMBEDDING_BATCH_MAX_ITEMS = 500
+EMBEDDING_CONCURRENCY = 4
+EMBEDDING_REQUESTS_PER_MINUTE = 3000
+EMBEDDING_TOKENS_PER_MINUTE = 1_000_000
+EMBEDDING_MAX_RETRIES = 6
+# Chunks are dropped before embedding when their 64-bit SimHash is within
+# this many bits of another chunk in the same thread, or when the same text
+# repeats in this many messages anywhere, like footers and boilerplate
+DEDUP_CHUNKS = True
+THREAD_SIMHASH_MAX_DISTANCE = 6
+BOILERPLATE_MIN_COPIES = 3
+# Dropped copies recorded on the chunk that is kept
+DUPLICATE_IDS_KEPT = 20
+SIMHASH_MIN_WORDS = 8
 SCORE_THRESHOLD = 0.2
 NUMBER_OF_DOCUMENTS = 3
+# "chroma", or "mmap" for the memory-mapped index in services/vector_backends.py
+VECTOR_BACKEND = "chroma"
+MMAP_VECTOR_DTYPE = "int8"
+RETRIEVAL_MODE = "hybrid"
+# Share of the non-stopword query terms an email needs for a lexical match;
+# hybrid search requires all of them when the vector search found nothing
+LEXICAL_MIN_COVERAGE = 0.5
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_TTL = 600
+AGENT_MODEL = "gpt-4o"
+AGENT_PROMPT = "hwchase17/openai-tools-agent"
+# Replaces the hub prompt's generic system message
+AGENT_SYSTEM_MESSAGE = (
+    "You are an AI assistant that can provide helpful answers using available "
+    "tools.\nIf you are unable to answer, you can use the following tools: "
+    "Time and Wikipedia."
+)
+MEMORY_TOKEN_BUDGET = 2000
+MEMORY_SUMMARY_MODEL = "gpt-4o-mini"
+COMPLETION_CACHE_TTL = 7 * 24 * 3600
+COMPLETION_CACHE_MAX_ENTRIES = 50_000
+# Bump to invalidate every cached completion after a prompt change
+COMPLETION_CACHE_VERSION = 1
+# Also cache the agent's own model calls; off since turns rarely repeat
+AGENT_LLM_CACHE = False
+# One HTTP connection pool is shared by every OpenAI client and model
+OPENAI_MAX_CONNECTIONS = 50
+OPENAI_MAX_KEEPALIVE = 20
+OPENAI_KEEPALIVE_EXPIRY = 120
+OPENAI_CONNECT_TIMEOUT = 5
+OPENAI_TIMEOUT = 60
+OPENAI_MAX_RETRIES = 3
+# Deadline for the short summary and hashtag completions
+OPENAI_SERVICE_TIMEOUT = 30
+NEWS_MAX_RESULTS = 10
+NEWS_CACHE_SIZE = 256
+NEWS_CACHE_TTL = 1800
+# Refresh the prefetched topics before their cache entries expire
+NEWS_PREFETCH_INTERVAL = 1500
+NEWS_PREFETCH_WORKERS = 4
+# fetch_news_article defaults to India, the news tool's schema to the US
+NEWS_PREFETCH_REGIONS = [("en", "IN"), ("en", "US")]
+NEWS_DIGEST_TOPICS = ["WORLD", "SCIENCE", "ECONOMY"]
+NEWS_DIGEST_PER_QUERY = 3
+NEWS_DIGEST_CONCURRENCY = 8
+NEWS_SUMMARY_REQUESTS_PER_MINUTE = 120
+IMAGE_MODEL = "dall-e-2"
+IMAGE_SIZE = "512x512"
+IMAGE_COUNT = 3
+IMAGE_CONCURRENCY = 4
+IMAGE_TIMEOUT = 120
+# Each entry holds IMAGE_COUNT images of IMAGE_SIZE, about 1 MB in all
+IMAGE_CACHE_MAX_ENTRIES = 500
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+MAX_SESSIONS = 1000
+SESSION_TTL = 3600
+# Turns of one session share its memory, so they run one at a time
+SESSION_MAX_CONCURRENCY = 1
+# Sync tools wait on Gmail and news APIs, so the server runs them on more
+# threads than the default executor's CPU-based size
+SERVER_TOOL_THREADS = 32
 VERBOSE = True
+
+vector_store_directory = (
+    mmap_directory if VECTOR_BACKEND == "mmap" else persistent_directory
+)
@@ -1,66 +1,102 @@
-import sys
+import time
 
-from dotenv import load_dotenv
-from langchain import hub
-from langchain.agents import AgentExecutor, create_structured_chat_agent
-from langchain.memory import ConversationSummaryMemory
-from langchain_community.chat_models import ChatOpenAI
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+# Started before the other imports so the startup time includes them
+start_time = time.perf_counter()
 
-from config import VERBOSE
-from tools import hashtag_tool, news_tool, search_gmail_combined_tool, datetime_tool
+import asyncio  # noqa: E402
+import sys  # noqa: E402
+from concurrent.futures import ThreadPoolExecutor  # noqa: E402
 
-load_dotenv()
-
-# Define the tools that the agent can use
-tools = [datetime_tool, search_gmail_combined_tool, news_tool, hashtag_tool]
-
-# Load the correct JSON Chat Prompt from the hub
-prompt = hub.pull("hwchase17/structured-chat-agent")
-
-# Initialize a ChatOpenAI model
-llm = ChatOpenAI(model="gpt-4o")
-
-# Create a Conversation Summary Memory
-memory = ConversationSummaryMemory(llm=llm, memory_key="summary")
+from dotenv import load_dotenv  # noqa: E402
 
-# Create a structured Chat Agent with Conversation Summary Memory
-agent = create_structured_chat_agent(llm=llm, tools=tools, prompt=prompt)
+from agent import astream_answer, build_agent_executor  # noqa: E402
+from logging_config import get_logger  # noqa: E402
+from services.news_engine import start_news_prefetch  # noqa: E402
 
-agent_executor = AgentExecutor.from_agent_and_tools(
-    agent=agent,
-    tools=tools,
-    verbose=VERBOSE,
-    memory=memory,
-    handle_parsing_errors=True,
-)
-
-initial_message = "You are an AI assistant that can provide helpful answers using available tools.\nIf you are unable to answer, you can use the following tools: Time and Wikipedia."
-memory.chat_memory.add_message(SystemMessage(content=initial_message))
+load_dotenv()
 
-# Chat Loop to interact with the user
-while True:
-    user_input = input("User: ")
-    if user_input.lower() == "exit":
-        break
+logger = get_logger(__name__)
 
-    memory.chat_memory.add_user_message(HumanMessage(content=user_input))
 
+async def answer(agent_executor, user_input):
+    """Print the agent's answer as it streams in and return the full text."""
     # Show loading message
     sys.stdout.write("Bot is thinking...\r")
     sys.stdout.flush()
 
-    # Call the agent
-    try:
-        response = agent_executor.invoke({"input": user_input})
-        # Print the bot's response
-        print("Bot:", response["output"])
-
-        memory.chat_memory.add_ai_message(AIMessage(content=response["output"]))
-    except Exception as e:
-        print("Error:", str(e))
-
-    # Clear loading message
-    sys.stdout.write(" " * 20 + "\r")
+    start = time.perf_counter()
+    first_token = None
+    tokens = []
+    async for token in astream_answer(agent_executor, user_input):
+        if first_token is None:
+            first_token = time.perf_counter() - start
+            # Replace the loading message with the answer
+            sys.stdout.write(" " * 20 + "\rBot: ")
+        tokens.append(token)
+        sys.stdout.write(token)
+        sys.stdout.flush()
+
+    if first_token is None:
+        # Clear loading message
+        sys.stdout.write(" " * 20 + "\r")
+    else:
+        sys.stdout.write("\n")
+        logger.info(
+            f"First token after {first_token:.2f}s, answer complete after "
+            f"{time.perf_counter() - start:.2f}s"
+        )
     sys.stdout.flush()
+    return "".join(tokens)
+
+
+def _log_build_time(agent_future, build_timings):
+    """Log how long each phase of the background agent build took."""
+    if agent_future.cancelled() or agent_future.exception() is not None:
+        return
+    logger.info(
+        f"Startup: agent built in {sum(build_timings.values()):.2f}s ("
+        + ", ".join(f"{phase} {secs:.2f}s" for phase, secs in build_timings.items())
+        + ")"
+    )
+
+
+async def chat():
+    # Build the agent in the background so the prompt shows up right away;
+    # the first question waits for it to finish
+    build_timings = {}
+    build_pool = ThreadPoolExecutor(max_workers=1)
+    agent_future = asyncio.wrap_future(
+        build_pool.submit(build_agent_executor, build_timings)
+    )
+    # Warm the news cache once the agent is built
+    build_pool.submit(start_news_prefetch)
+    build_pool.shutdown(wait=False)
+
+    logger.info(f"Startup: prompt ready in {time.perf_counter() - start_time:.2f}s")
+    agent_future.add_done_callback(
+        lambda future: _log_build_time(future, build_timings)
+    )
+    agent_executor = None
+
+    # Chat Loop to interact with the user
+    while True:
+        user_input = await asyncio.to_thread(input, "User: ")
+        if user_input.lower() == "exit":
+            break
+
+        if agent_executor is None:
+            try:
+                agent_executor = await agent_future
+            except Exception as e:
+                print("Error:", str(e))
+                break
+
+        # Call the agent; the executor saves the turn to its memory
+        try:
+            await answer(agent_executor, user_input)
+        except Exception as e:
+            print("Error:", str(e))
+
+
+if __name__ == "__main__":
+    asyncio.run(chat())
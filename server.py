@@ -0,0 +1,188 @@
+import asyncio
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+
+import uvicorn
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
+
+from agent import SharedAgent, astream_answer, build_shared_agent
+from config import (MAX_SESSIONS, SERVER_HOST, SERVER_PORT,
+                    SERVER_TOOL_THREADS, SESSION_MAX_CONCURRENCY, SESSION_TTL)
+from logging_config import get_logger
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+
+class ChatRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+
+
+class ChatResponse(BaseModel):
+    session_id: str
+    output: str
+
+
+@dataclass
+class Session:
+    executor: Any
+    semaphore: asyncio.Semaphore
+
+
+class SessionStore:
+    """Per-session agent executors over one shared agent.
+
+    Each session has its own memory and runs at most
+    SESSION_MAX_CONCURRENCY turns at a time; further turns wait. Sessions
+    idle for SESSION_TTL seconds are dropped, and the least recently used
+    one goes first once MAX_SESSIONS are open.
+    """
+
+    def __init__(self, shared_agent: SharedAgent):
+        self.shared_agent = shared_agent
+        self._sessions = TTLCache(maxsize=MAX_SESSIONS, ttl=SESSION_TTL)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id: Optional[str] = None) -> Tuple[str, Session]:
+        """Return the session, creating it when the id is new or missing."""
+        session_id = session_id or uuid.uuid4().hex
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(
+                executor=self.shared_agent.new_executor(),
+                semaphore=asyncio.Semaphore(SESSION_MAX_CONCURRENCY),
+            )
+        # Setting it again restarts the idle timer
+        self._sessions[session_id] = session
+        return session_id, session
+
+    def remove(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+
+def warm_resources():
+    """Open the vector store, clients and Gmail service, and warm the news."""
+    from services.gmail_search import warm_gmail_service
+    from services.news_engine import start_news_prefetch
+    from services.openai_client import (get_async_openai_client,
+                                        get_openai_client)
+    from tools.gmail_rag_tool import get_vector_store
+
+    get_vector_store()
+    get_openai_client()
+    get_async_openai_client()
+    start_news_prefetch()
+    if not warm_gmail_service():
+        logger.warning("No saved Gmail token; Gmail will sign in on first use.")
+
+
+def create_app(shared_agent: Optional[SharedAgent] = None) -> FastAPI:
+    """Create the chat server.
+
+    The agent, vector store and clients are built once at startup and shared
+    by every session. Pass ``shared_agent`` to serve a prebuilt agent
+    without warming the real backends.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Sync tools run on the loop's default executor
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(
+                max_workers=SERVER_TOOL_THREADS, thread_name_prefix="tool"
+            )
+        )
+        agent = shared_agent
+        if agent is None:
+            start = time.perf_counter()
+            agent = await asyncio.to_thread(build_shared_agent)
+            await asyncio.to_thread(warm_resources)
+            logger.info(f"Server ready in {time.perf_counter() - start:.2f}s")
+        app.state.sessions = SessionStore(agent)
+        yield
+
+    app = FastAPI(title="Assistant", lifespan=lifespan)
+
+    @app.get("/health")
+    async def health():
+        from services.completion_cache import get_completion_cache
+
+        return {
+            "status": "ok",
+            "sessions": len(app.state.sessions),
+            "completion_cache": get_completion_cache().stats(),
+        }
+
+    @app.post("/chat", response_model=ChatResponse)
+    async def chat(request: ChatRequest):
+        session_id, session = app.state.sessions.get(request.session_id)
+        async with session.semaphore:
+            try:
+                response = await session.executor.ainvoke({"input": request.message})
+            except Exception as e:
+                logger.error(f"Session {session_id} failed: {e}")
+                raise HTTPException(status_code=500, detail=str(e)) from e
+        return ChatResponse(session_id=session_id, output=response["output"])
+
+    @app.delete("/sessions/{session_id}")
+    async def end_session(session_id: str):
+        if not app.state.sessions.remove(session_id):
+            raise HTTPException(status_code=404, detail="Unknown session")
+        return {"session_id": session_id}
+
+    @app.websocket("/ws")
+    async def chat_stream(websocket: WebSocket, session_id: Optional[str] = None):
+        """Stream answers token by token over a WebSocket.
+
+        Every text message is a question; the reply is a series of
+        ``token`` events followed by an ``end`` event with the full answer.
+        """
+
+        async def send(event):
+            try:
+                await websocket.send_json(event)
+            except RuntimeError as e:
+                # Starlette raises this once the socket has been closed
+                raise WebSocketDisconnect() from e
+
+        await websocket.accept()
+        session_id, _ = app.state.sessions.get(session_id)
+        try:
+            await send({"type": "session", "session_id": session_id})
+            while True:
+                message = await websocket.receive_text()
+                # Looked up per message so an expired session starts afresh
+                _, session = app.state.sessions.get(session_id)
+                async with session.semaphore:
+                    tokens = []
+                    try:
+                        async for token in astream_answer(session.executor, message):
+                            tokens.append(token)
+                            await send({"type": "token", "content": token})
+                    except WebSocketDisconnect:
+                        # The client is gone, so there is no one to tell
+                        raise
+                    except Exception as e:
+                        logger.error(f"Session {session_id} failed: {e}")
+                        await send({"type": "error", "detail": str(e)})
+                        continue
+                await send({"type": "end", "output": "".join(tokens)})
+        except WebSocketDisconnect:
+            logger.info(f"Session {session_id} disconnected")
+
+    return app
+
+
+if __name__ == "__main__":
+    uvicorn.run(create_app(), host=SERVER_HOST, port=SERVER_PORT)
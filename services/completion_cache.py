@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Dict, List, Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from config import (COMPLETION_CACHE_MAX_ENTRIES, COMPLETION_CACHE_TTL,
+                    COMPLETION_CACHE_VERSION, OPENAI_SERVICE_TIMEOUT,
+                    completion_cache_path)
+from logging_config import get_logger
+from services.openai_client import get_async_openai_client, get_openai_client
+from services.rate_limit import RateLimiter
+
+logger = get_logger(__name__)
+
+
+class CompletionCache:
+    """On-disk SQLite cache of model completions.
+
+    Keys are hashed from the cache policy version and whatever identifies a
+    request: model, messages, temperature and other parameters. Entries
+    expire ``ttl`` seconds after they were written and are evicted least
+    recently used first once ``max_entries`` is exceeded. Bump
+    COMPLETION_CACHE_VERSION to drop every entry after a prompt change.
+    """
+
+    def __init__(
+        self,
+        cache_path: str,
+        ttl: float = COMPLETION_CACHE_TTL,
+        max_entries: int = COMPLETION_CACHE_MAX_ENTRIES,
+        version: int = COMPLETION_CACHE_VERSION,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS completions_last_used "
+            "ON completions (last_used)"
+        )
+        self._size = self._count()
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    def key(self, **request: Any) -> str:
+        """Return the cache key for a request given as keyword arguments."""
+        payload = json.dumps(
+            {"version": self.version, **request}, sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._size -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE completions SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            replaced = self._conn.execute(
+                "SELECT 1 FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, created, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if not replaced:
+                self._size += 1
+            if self._size > self.max_entries:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Drop expired entries, then the least recently used down to 90%."""
+        self._conn.execute(
+            "DELETE FROM completions WHERE created < ?", (now - self.ttl,)
+        )
+        self._size = self._count()
+        excess = self._size - int(self.max_entries * 0.9)
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM completions WHERE key IN "
+            "(SELECT key FROM completions ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._size -= excess
+        logger.info(f"Evicted {excess} entries from the completion cache")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+            self._size = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters for this process."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._size,
+        }
+
+
+_cache: Optional[CompletionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache() -> CompletionCache:
+    """Return the process-wide completion cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CompletionCache(completion_cache_path)
+    return _cache
+
+
+def cached_chat_completion(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 1.0,
+    timeout: float = OPENAI_SERVICE_TIMEOUT,
+    limiter: Optional[RateLimiter] = None,
+) -> str:
+    """Return the chat completion text, calling OpenAI only on a cache miss.
+
+    ``timeout`` is the deadline in seconds for each attempt at the call.
+    ``limiter`` is acquired before the call, so cache hits never wait on it.
+    """
+    cache = get_completion_cache()
+    key = cache.key(model=model, messages=messages, temperature=temperature)
+    content = cache.get(key)
+    if content is None:
+        if limiter is not None:
+            limiter.acquire()
+        response = get_openai_client(timeout).chat.completions.create(
+            model=model, messages=messages, temperature=temperature
+        )
+        content = response.choices[0].message.content
+        cache.put(key, content)
+    return content
+
+
+async def acached_chat_completion(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 1.0,
+    timeout: float = OPENAI_SERVICE_TIMEOUT,
+) -> str:
+    """Async version of cached_chat_completion.
+
+    The SQLite reads and writes run in a worker thread, off the event loop.
+    """
+    cache = get_completion_cache()
+    key = cache.key(model=model, messages=messages, temperature=temperature)
+    content = await asyncio.to_thread(cache.get, key)
+    if content is None:
+        response = await get_async_openai_client(timeout).chat.completions.create(
+            model=model, messages=messages, temperature=temperature
+        )
+        content = response.choices[0].message.content
+        await asyncio.to_thread(cache.put, key, content)
+    return content
+
+
+class LangChainCompletionCache(BaseCache):
+    """LangChain model cache stored in a CompletionCache.
+
+    Pass it as ``cache=`` to a chat model so identical calls are answered
+    from disk instead of the API.
+    """
+
+    def __init__(self, cache: CompletionCache):
+        self.cache = cache
+
+    def lookup(self, prompt: str, llm_string: str):
+        value = self.cache.get(self.cache.key(prompt=prompt, llm=llm_string))
+        if value is None:
+            return None
+        with warnings.catch_warnings():
+            # loads() is marked beta; the cache only holds what dumps() wrote
+            warnings.simplefilter("ignore")
+            return loads(value)
+
+    def update(self, prompt: str, llm_string: str, return_val):
+        self.cache.put(self.cache.key(prompt=prompt, llm=llm_string), dumps(return_val))
+
+    def clear(self, **kwargs: Any):
+        self.cache.clear()
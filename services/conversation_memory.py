@@ -0,0 +1,156 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import (BaseMessage, SystemMessage,
+                                     get_buffer_string)
+from langchain_core.output_parsers import StrOutputParser
+from pydantic import PrivateAttr
+
+from config import MEMORY_TOKEN_BUDGET
+from logging_config import get_logger
+from services.embedding_pipeline import count_tokens
+
+logger = get_logger(__name__)
+
+# Shared by every conversation; each memory runs at most one job at a time
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+
+# Rough per-message overhead of the chat format on top of the content
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+def _message_tokens(message: BaseMessage) -> int:
+    content = message.content
+    if not isinstance(content, str):
+        content = str(content)
+    return count_tokens(content) + MESSAGE_TOKEN_OVERHEAD
+
+
+class BudgetedWindowMemory(BaseChatMemory):
+    """Chat memory keeping recent turns verbatim within a token budget.
+
+    When the kept turns go over ``max_token_limit`` the oldest ones are moved
+    out and folded into a running summary in a background thread, so no
+    model call is made while answering. Until the summary catches up the
+    moved turns are still returned verbatim, after the summary so far. A
+    failed summary is retried on the next load, and while it keeps failing
+    the oldest moved turns beyond ``max_token_limit`` are dropped.
+    """
+
+    llm: BaseLanguageModel
+    memory_key: str = "chat_history"
+    max_token_limit: int = MEMORY_TOKEN_BUDGET
+    return_messages: bool = True
+    summary: str = ""
+
+    _pending: List[BaseMessage] = PrivateAttr(default_factory=list)
+    _summarizing: bool = PrivateAttr(default=False)
+    # Bumped by clear() so a summary started before it is discarded
+    _generation: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        self._schedule_summary()
+        with self._lock:
+            messages = self._pending + self.chat_memory.messages
+            if self.summary:
+                messages = [
+                    SystemMessage(
+                        content=f"Summary of the earlier conversation:\n{self.summary}"
+                    )
+                ] + messages
+        if not self.return_messages:
+            return {self.memory_key: get_buffer_string(messages)}
+        return {self.memory_key: messages}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        self._evict()
+
+    async def asave_context(
+        self, inputs: Dict[str, Any], outputs: Dict[str, str]
+    ) -> None:
+        await super().asave_context(inputs, outputs)
+        self._evict()
+
+    def _evict(self):
+        """Move the oldest turns over the budget out and summarize them."""
+        with self._lock:
+            messages = self.chat_memory.messages
+            tokens = [_message_tokens(message) for message in messages]
+            total = sum(tokens)
+            cut = 0
+            # Turns are a human and an AI message; the latest is always kept
+            while cut + 2 < len(messages) and total > self.max_token_limit:
+                total -= tokens[cut] + tokens[cut + 1]
+                cut += 2
+            if not cut:
+                return
+            self._pending.extend(messages[:cut])
+            self.chat_memory.clear()
+            self.chat_memory.add_messages(messages[cut:])
+        self._schedule_summary()
+
+    def _schedule_summary(self):
+        """Summarize the pending turns in the background unless already running."""
+        with self._lock:
+            if not self._pending or self._summarizing:
+                return
+            self._summarizing = True
+        _summary_executor.submit(self._summarize)
+
+    def _trim_pending(self):
+        """Drop the oldest pending turns until the rest fit the budget."""
+        tokens = sum(_message_tokens(message) for message in self._pending)
+        cut = 0
+        while cut < len(self._pending) and tokens > self.max_token_limit:
+            tokens -= sum(_message_tokens(m) for m in self._pending[cut : cut + 2])
+            cut += 2
+        if cut:
+            del self._pending[:cut]
+            logger.warning(f"Dropped {cut} older messages that could not be summarized")
+
+    def _summarize(self):
+        chain = SUMMARY_PROMPT | self.llm | StrOutputParser()
+        while True:
+            with self._lock:
+                batch = list(self._pending)
+                summary = self.summary
+                generation = self._generation
+                if not batch:
+                    self._summarizing = False
+                    return
+            try:
+                new_summary = chain.invoke(
+                    {"summary": summary, "new_lines": get_buffer_string(batch)}
+                )
+            except Exception as e:
+                # The turns stay pending and are retried on the next load
+                logger.error(f"Conversation summary failed: {e}")
+                with self._lock:
+                    if generation == self._generation:
+                        self._trim_pending()
+                    self._summarizing = False
+                return
+            with self._lock:
+                if generation != self._generation:
+                    # Cleared meanwhile; the summary is of the old conversation
+                    continue
+                self.summary = new_summary.strip()
+                del self._pending[: len(batch)]
+            logger.info(f"Summarized {len(batch)} older messages")
+
+    def clear(self) -> None:
+        super().clear()
+        with self._lock:
+            self.summary = ""
+            self._pending.clear()
+            self._generation += 1
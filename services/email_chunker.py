@@ -0,0 +1,256 @@
+import hashlib
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config import (BOILERPLATE_MIN_COPIES, DEDUP_CHUNKS, DUPLICATE_IDS_KEPT,
+                     SIMHASH_MIN_WORDS, THREAD_SIMHASH_MAX_DISTANCE)
+from logging_config import get_logger
+from services.email_metadata import email_epoch, email_metadata
+from services.email_store import iter_emails
+from services.embedding_pipeline import count_tokens
+from services.lexical_index import tokenize
+
+logger = get_logger(__name__)
+
+# Bodies are cleaned to a single line, so quotes are recognised by their
+# attribution lines rather than by leading ">" markers. The Gmail pattern
+# needs a digit so prose such as "On the form I wrote:" is left alone.
+_QUOTE_HEADER = re.compile(
+    r"\bOn\s[^\n]{0,200}?\d[^\n]{0,200}?\bwrote:"
+    r"|-{2,}\s*Original Message\s*-{2,}"
+    r"|\bFrom:\s[^\n]{0,200}?\bSent:\s[^\n]{0,200}?\bTo:\s",
+    re.IGNORECASE,
+)
+SIGNATURE_MAX_CHARS = 300
+# The "-- " delimiter is inline too; it only starts a signature when no more
+# than SIGNATURE_MAX_CHARS follow it, so dashes earlier in prose are kept
+_SIGNATURE = re.compile(
+    rf"(?:(?:^|\s)-- |\bSent from my\s).{{0,{SIGNATURE_MAX_CHARS}}}$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def strip_quoted_reply(text: str) -> str:
+    """Cut the body at the first quoted-reply header, keeping the new text."""
+    match = _QUOTE_HEADER.search(text)
+    return text[: match.start()].rstrip() if match else text
+
+
+def strip_signature(text: str) -> str:
+    """Cut a trailing "-- " or "Sent from my ..." signature block."""
+    match = _SIGNATURE.search(text)
+    return text[: match.start()].rstrip() if match else text
+
+
+@lru_cache(maxsize=1 << 18)
+def _word_hash(word: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def _text_hash(words: List[str]) -> str:
+    return hashlib.blake2b(" ".join(words).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _rotate(values: np.ndarray, bits: int) -> np.ndarray:
+    return (values << np.uint64(bits)) | (values >> np.uint64(64 - bits))
+
+
+def simhash(words: List[str]) -> int:
+    """Return the 64-bit SimHash of the word 3-gram shingles of a chunk."""
+    if not words:
+        return 0
+    hashes = np.fromiter(
+        (_word_hash(word) for word in words), dtype=np.uint64, count=len(words)
+    )
+    if len(hashes) >= 3:
+        hashes = hashes[:-2] ^ _rotate(hashes[1:-1], 1) ^ _rotate(hashes[2:], 2)
+    bits = np.unpackbits(
+        hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little"
+    )
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(hashes)
+    return int(np.packbits(votes, bitorder="little").view(np.uint64)[0])
+
+
+class ThreadDedupChunker:
+    """Split emails into chunks without quoted history, footers or repeats.
+
+    Messages are grouped by Gmail threadId. Every message but the first of
+    its thread has its quoted reply cut off, since the earlier message holds
+    that text already; records without a threadId count as threads of their
+    own and are never cut. Signatures are cut everywhere. Chunks are then
+    visited oldest message first. A chunk is dropped when its SimHash is
+    within THREAD_SIMHASH_MAX_DISTANCE bits of a kept chunk in the same
+    thread, or when the same text appears in at least BOILERPLATE_MIN_COPIES
+    messages and is kept elsewhere. Near-duplicates in different threads
+    are kept, since templated order or shipping emails differ only in the
+    order number, amount or date. Chunks shorter than SIMHASH_MIN_WORDS
+    words only match exactly.
+
+    The surviving chunk's metadata lists the dropped copies' message ids
+    and epochs in ``duplicate_ids`` and ``duplicate_epochs``, the newest
+    DUPLICATE_IDS_KEPT of them, with their total in ``duplicate_count``.
+    Keeping the oldest copy makes the choice independent of file order and
+    stable as new mail arrives, so chunk ids only change when the corpus
+    does. ``stats`` holds the savings against plain splitting once
+    ``iter_chunks`` has been consumed.
+    """
+
+    def __init__(self, text_splitter, dedup: bool = DEDUP_CHUNKS):
+        self.text_splitter = text_splitter
+        self.dedup = dedup
+        self.stats: Dict[str, int] = {}
+
+    @staticmethod
+    def _thread_id(email: Dict) -> str:
+        return email.get("threadId") or email["id"]
+
+    def _thread_starts(self, emails_path: str) -> Dict[str, str]:
+        """Map each thread id to the id of its oldest message."""
+        first = {}
+        for email in iter_emails(emails_path):
+            thread_id = self._thread_id(email)
+            key = (email_epoch(email), email["id"])
+            if thread_id not in first or key < first[thread_id]:
+                first[thread_id] = key
+        return {thread_id: key[1] for thread_id, key in first.items()}
+
+    def _body(self, email: Dict, thread_starts: Dict[str, str]) -> str:
+        body = str(email["body"])
+        if self.dedup:
+            if thread_starts[self._thread_id(email)] != email["id"]:
+                body = strip_quoted_reply(body)
+            body = strip_signature(body)
+        return body
+
+    def _split(self, email: Dict, thread_starts: Dict[str, str]) -> List[Document]:
+        document = Document(
+            page_content=self._body(email, thread_starts),
+            metadata=email_metadata(email),
+        )
+        return self.text_splitter.split_documents([document])
+
+    def _plan(self, emails_path: str, thread_starts: Dict[str, str]):
+        """Map each (message id, chunk index) worth embedding to its copies.
+
+        The copies are the dropped chunks' (message id, epoch) pairs, oldest
+        first.
+        """
+        stats = dict.fromkeys(
+            (
+                "plain_chunks",
+                "plain_tokens",
+                "chunks",
+                "tokens",
+                "stripped_messages",
+                "duplicates",
+                "thread_duplicates",
+            ),
+            0,
+        )
+        candidates = []
+        copies: Dict[str, set] = defaultdict(set)
+        for email in iter_emails(emails_path):
+            plain = self.text_splitter.split_text(str(email["body"]))
+            stats["plain_chunks"] += len(plain)
+            stats["plain_tokens"] += sum(count_tokens(text) for text in plain)
+
+            body = self._body(email, thread_starts)
+            if len(body) < len(str(email["body"])):
+                stats["stripped_messages"] += 1
+            order = (email_epoch(email), email["id"])
+            for index, text in enumerate(self.text_splitter.split_text(body)):
+                words = tokenize(text)
+                digest = _text_hash(words)
+                copies[digest].add(email["id"])
+                candidates.append(
+                    (
+                        order,
+                        index,
+                        self._thread_id(email),
+                        digest,
+                        simhash(words),
+                        len(words) >= SIMHASH_MIN_WORDS,
+                        count_tokens(text),
+                    )
+                )
+
+        keep: Dict[Tuple[str, int], List[Tuple[str, int]]] = {}
+        kept_texts: Dict[str, Tuple[str, int]] = {}
+        threads: Dict[str, List[Tuple]] = defaultdict(list)
+        for candidate in sorted(candidates):
+            (epoch, msg_id), index, thread_id, digest = candidate[:4]
+            fingerprint, long_enough, tokens = candidate[4:]
+            if self.dedup:
+                survivor = None
+                if len(copies[digest]) >= BOILERPLATE_MIN_COPIES:
+                    survivor = kept_texts.get(digest)
+                    if survivor is not None:
+                        stats["duplicates"] += 1
+                if survivor is None:
+                    for other, other_digest, other_key in threads[thread_id]:
+                        distance = (fingerprint ^ other).bit_count()
+                        if digest == other_digest or (
+                            long_enough and distance <= THREAD_SIMHASH_MAX_DISTANCE
+                        ):
+                            survivor = other_key
+                            stats["thread_duplicates"] += 1
+                            break
+                if survivor is not None:
+                    if survivor[0] != msg_id:
+                        keep[survivor].append((msg_id, epoch))
+                    continue
+                kept_texts.setdefault(digest, (msg_id, index))
+                threads[thread_id].append((fingerprint, digest, (msg_id, index)))
+            keep[(msg_id, index)] = []
+            stats["chunks"] += 1
+            stats["tokens"] += tokens
+
+        self.stats = stats
+        return keep
+
+    def iter_chunks(self, emails_path: str) -> Iterator[Tuple[str, int, Document]]:
+        """Yield (message id, chunk index, chunk) for every chunk to embed.
+
+        The emails file is read three times: once for thread starts, once to
+        fingerprint and choose chunks, and once to yield them, so chunk texts
+        are never all held in memory.
+        """
+        thread_starts = self._thread_starts(emails_path)
+        keep = self._plan(emails_path, thread_starts)
+        for email in iter_emails(emails_path):
+            for index, chunk in enumerate(self._split(email, thread_starts)):
+                duplicates = keep.get((email["id"], index))
+                if duplicates is None:
+                    continue
+                if duplicates:
+                    newest = duplicates[-DUPLICATE_IDS_KEPT:]
+                    chunk.metadata["duplicate_ids"] = ", ".join(
+                        msg_id for msg_id, _ in newest
+                    )
+                    chunk.metadata["duplicate_epochs"] = ", ".join(
+                        str(epoch) for _, epoch in newest
+                    )
+                    chunk.metadata["duplicate_count"] = len(duplicates)
+                yield email["id"], index, chunk
+
+        stats = self.stats
+        saved_chunks = stats["plain_chunks"] - stats["chunks"]
+        saved_tokens = stats["plain_tokens"] - stats["tokens"]
+        logger.info(
+            f"Chunker kept {stats['chunks']}/{stats['plain_chunks']} chunks and "
+            f"{stats['tokens']}/{stats['plain_tokens']} tokens, saving "
+            f"{saved_chunks} chunks "
+            f"({saved_chunks / max(stats['plain_chunks'], 1):.0%}) "
+            f"and {saved_tokens} tokens "
+            f"({saved_tokens / max(stats['plain_tokens'], 1):.0%}); "
+            f"quotes or signatures cut from {stats['stripped_messages']} messages, "
+            f"{stats['duplicates']} repeated boilerplate and "
+            f"{stats['thread_duplicates']} in-thread duplicate chunks dropped"
+        )
@@ -0,0 +1,99 @@
+import atexit
+import multiprocessing
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import List
+
+from config import CLEANER_POOL_MIN_BATCH, CLEANER_PROCESSES
+
+# This module only depends on the standard library so process pool workers
+# start quickly.
+
+_WHITESPACE = re.compile(r"\s+")
+_NON_PRINTABLE = re.compile(r"[^\x20-\x7E\n]")
+_SKIP_TAGS = frozenset(("script", "style"))
+
+
+class _TextExtractor(HTMLParser):
+    """Collect text nodes in one pass, skipping scripts, styles and the signature."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_tag = None
+        self._skip_depth = 0
+        self._signature_seen = False
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if tag in _SKIP_TAGS:
+            self._skip_tag, self._skip_depth = tag, 1
+        elif tag == "div" and not self._signature_seen:
+            # Only the first signature div is dropped, like soup.find() did
+            classes = (dict(attrs).get("class") or "").split()
+            if "signature" in classes:
+                self._signature_seen = True
+                self._skip_tag, self._skip_depth = tag, 1
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing tags never open a skipped region
+        pass
+
+    def handle_endtag(self, tag):
+        if self._skip_tag == tag:
+            self._skip_depth -= 1
+            if not self._skip_depth:
+                self._skip_tag = None
+
+    def handle_data(self, data):
+        if not self._skip_tag:
+            self.parts.append(data)
+
+
+def clean_email_body(body: str) -> str:
+    """Convert an HTML or plain-text body into a single line of printable text."""
+    if "<" in body or "&" in body:
+        extractor = _TextExtractor()
+        extractor.feed(body)
+        extractor.close()
+        body = "".join(extractor.parts)
+
+    # Collapse all whitespace, then drop non-printable characters
+    text = _WHITESPACE.sub(" ", body).strip()
+    return _NON_PRINTABLE.sub("", text).strip()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a process that already runs threads (the server's tool
+            # pool, the embedding workers) can copy a held lock and deadlock
+            method = (
+                "forkserver"
+                if "forkserver" in multiprocessing.get_all_start_methods()
+                else "spawn"
+            )
+            _pool = ProcessPoolExecutor(
+                max_workers=CLEANER_PROCESSES,
+                mp_context=multiprocessing.get_context(method),
+            )
+            atexit.register(_pool.shutdown)
+    return _pool
+
+
+def clean_email_bodies(bodies: List[str]) -> List[str]:
+    """Clean many bodies, spreading large batches over a process pool."""
+    if CLEANER_PROCESSES <= 1 or len(bodies) < CLEANER_POOL_MIN_BATCH:
+        return [clean_email_body(body) for body in bodies]
+    chunksize = max(1, len(bodies) // (CLEANER_PROCESSES * 4))
+    return list(_get_pool().map(clean_email_body, bodies, chunksize=chunksize))
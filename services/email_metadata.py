@@ -0,0 +1,271 @@
+import bisect
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from email.utils import parseaddr
+from typing import Dict, List, Optional, Set, Tuple
+
+# Display format of the email dict's "timestamp" field
+TIMESTAMP_FORMAT = "%Y, %b %d, %I:%M%p"
+LABEL_PREFIX = "label_"
+# Second-level domains that sit in front of a country code, as in amazon.co.uk
+_SECOND_LEVEL_DOMAINS = frozenset(("ac", "co", "com", "edu", "gov", "net", "org"))
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_GMAIL_LABEL_SEPARATORS = re.compile(r"[\s/]+")
+_RELATIVE_DATE = re.compile(r"^(\d+)\s*([dwmy])$")
+_RELATIVE_DAYS = {"d": 1, "w": 7, "m": 30, "y": 365}
+
+
+def normalize_label(label: str) -> str:
+    """Lowercase a Gmail label name and reduce it to ``[a-z0-9_]``."""
+    return _NON_WORD.sub("_", label.lower()).strip("_")
+
+
+def gmail_search_label(label: str) -> str:
+    """Spell a label name the way Gmail's ``label:`` operator expects it."""
+    return _GMAIL_LABEL_SEPARATORS.sub("-", label.strip().lower())
+
+
+def registered_domain(domain: str) -> str:
+    """Return the domain without subdomains, so "mail.amazon.in" gives "amazon.in"."""
+    parts = domain.split(".")
+    size = 2
+    if len(parts) > 2 and parts[-2] in _SECOND_LEVEL_DOMAINS and len(parts[-1]) == 2:
+        size = 3
+    return ".".join(parts[-size:])
+
+
+def normalize_sender(sender: str) -> Tuple[str, str, str]:
+    """Split a From header into (address, domain, organisation), lowercased.
+
+    The organisation is the domain label in front of the public suffix, so
+    "Amazon <auto-confirm@amazon.in>" gives "amazon".
+    """
+    address = parseaddr(sender)[1].lower()
+    domain = address.rpartition("@")[2]
+    organisation = registered_domain(domain).split(".")[0]
+    return address, domain, organisation
+
+
+def email_epoch(email: Dict) -> int:
+    """Return the email's Unix time, parsing the display timestamp if needed."""
+    if "epoch" in email:
+        return int(email["epoch"])
+    # Emails downloaded before the epoch field existed only carry the display
+    # string, which has minute precision in local time
+    return int(time.mktime(time.strptime(email["timestamp"], TIMESTAMP_FORMAT)))
+
+
+def email_metadata(email: Dict) -> Dict:
+    """Return the metadata stored with an email's chunks and index entries.
+
+    Alongside the display fields it holds the epoch time, the normalized
+    sender and one boolean flag per normalized label, all scalars so vector
+    stores can filter on them.
+    """
+    address, domain, organisation = normalize_sender(email["from"])
+    metadata = {
+        "id": email["id"],
+        "subject": email["subject"],
+        "from": email["from"],
+        "timestamp": email["timestamp"],
+        "labels": ", ".join(email["labels"]),
+        "epoch": email_epoch(email),
+        "sender": address,
+        "sender_domain": domain,
+        "sender_site": registered_domain(domain),
+        "sender_org": organisation,
+    }
+    if email.get("threadId"):
+        metadata["thread_id"] = email["threadId"]
+    for label in email["labels"]:
+        metadata[LABEL_PREFIX + normalize_label(label)] = True
+    return metadata
+
+
+def display_metadata(metadata: Dict) -> Dict:
+    """Drop the filter-only fields before metadata is shown to the agent."""
+    return {
+        key: metadata[key]
+        for key in ("id", "subject", "from", "timestamp", "labels", "duplicate_ids")
+        if key in metadata
+    }
+
+
+def metadata_labels(metadata: Dict) -> List[str]:
+    """Return the normalized labels flagged in stored metadata."""
+    return [
+        key[len(LABEL_PREFIX) :]
+        for key, value in metadata.items()
+        if key.startswith(LABEL_PREFIX) and value
+    ]
+
+
+def parse_date_bound(value: str, now: Optional[float] = None) -> int:
+    """Turn "YYYY-MM-DD" or a relative age such as "30d", "2w", "1m" into epoch.
+
+    Either way the result is the local midnight starting that day.
+    """
+    value = value.strip().lower()
+    match = _RELATIVE_DATE.match(value)
+    if match:
+        days = int(match.group(1)) * _RELATIVE_DAYS[match.group(2)]
+        # Rounded down to local midnight, like a YYYY-MM-DD bound, so the
+        # bound and the query cache key stay the same all day
+        then = datetime.fromtimestamp(now if now is not None else time.time())
+        day = then.date() - timedelta(days=days)
+        return int(datetime.combine(day, datetime.min.time()).timestamp())
+    try:
+        return int(datetime.strptime(value, "%Y-%m-%d").timestamp())
+    except ValueError:
+        raise ValueError(
+            f"Invalid date {value!r}, use YYYY-MM-DD or an age like 7d, 2w, 1m, 1y"
+        )
+
+
+@dataclass(frozen=True)
+class MetadataFilter:
+    """Label, sender and date constraints applied before similarity search.
+
+    ``labels`` must all be present. ``sender`` matches the full address when
+    it contains "@", the domain and its subdomains when it contains ".", and
+    the organisation otherwise. ``after`` is inclusive and ``before``
+    exclusive, in epoch seconds. ``gmail_labels`` keeps the labels as Gmail
+    spells them for the live search; it does not take part in comparisons.
+    """
+
+    labels: Tuple[str, ...] = ()
+    sender: Optional[str] = None
+    after: Optional[int] = None
+    before: Optional[int] = None
+    gmail_labels: Tuple[str, ...] = field(default=(), compare=False)
+
+    @classmethod
+    def from_query(
+        cls,
+        labels: Optional[List[str]] = None,
+        sender: Optional[str] = None,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+    ) -> "MetadataFilter":
+        """Build a filter from tool arguments, normalizing every field."""
+        sender = (sender or "").strip().lower()
+        return cls(
+            labels=tuple(sorted({normalize_label(label) for label in labels or ()})),
+            sender=sender or None,
+            after=parse_date_bound(after) if after else None,
+            before=parse_date_bound(before) if before else None,
+            gmail_labels=tuple(
+                sorted({gmail_search_label(label) for label in labels or ()})
+            ),
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.conditions())
+
+    @property
+    def sender_field(self) -> str:
+        if "@" in self.sender:
+            return "sender"
+        if "." not in self.sender:
+            return "sender_org"
+        # "amazon.in" also matches mail.amazon.in; a domain that is itself a
+        # subdomain only matches exactly
+        if registered_domain(self.sender) == self.sender:
+            return "sender_site"
+        return "sender_domain"
+
+    def conditions(self) -> List[Tuple[str, str, object]]:
+        """Return the constraints as (field, operator, value) triples."""
+        conditions = [(LABEL_PREFIX + label, "==", True) for label in self.labels]
+        if self.sender:
+            conditions.append((self.sender_field, "==", self.sender))
+        if self.after is not None:
+            conditions.append(("epoch", ">=", self.after))
+        if self.before is not None:
+            conditions.append(("epoch", "<", self.before))
+        return conditions
+
+    def to_chroma_where(self) -> Optional[Dict]:
+        """Return the equivalent Chroma ``where`` clause, or None if empty."""
+        operators = {"==": "$eq", ">=": "$gte", "<": "$lt"}
+        clauses = [
+            {field: {operators[operator]: value}}
+            for field, operator, value in self.conditions()
+        ]
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def to_gmail_query(self) -> str:
+        """Return the equivalent Gmail search operators."""
+        terms = [f"label:{label}" for label in self.gmail_labels]
+        if self.sender:
+            terms.append(f"from:{self.sender}")
+        # Gmail accepts epoch seconds for after: and before:
+        if self.after is not None:
+            terms.append(f"after:{self.after}")
+        if self.before is not None:
+            terms.append(f"before:{self.before}")
+        return " ".join(terms)
+
+
+class MetadataIndex:
+    """In-memory prefilter index from metadata values to document ids.
+
+    Equality fields map each value to the ids carrying it and epochs are
+    kept sorted, so a filter is answered with set intersections and a
+    bisected range instead of a scan over every document.
+    """
+
+    def __init__(self):
+        self._values: Dict[Tuple[str, object], Set[str]] = {}
+        self._epochs: List[Tuple[int, str]] = []
+        self._keys: Dict[str, List[Tuple[str, object]]] = {}
+
+    def add(self, doc_id: str, metadata: Dict):
+        self.remove(doc_id)
+        keys = [(LABEL_PREFIX + label, True) for label in metadata_labels(metadata)]
+        keys += [
+            (field, metadata[field])
+            for field in ("sender", "sender_domain", "sender_site", "sender_org")
+            if metadata.get(field)
+        ]
+        for key in keys:
+            self._values.setdefault(key, set()).add(doc_id)
+        if metadata.get("epoch") is not None:
+            bisect.insort(self._epochs, (metadata["epoch"], doc_id))
+            keys.append(("epoch", metadata["epoch"]))
+        self._keys[doc_id] = keys
+
+    def remove(self, doc_id: str):
+        for key in self._keys.pop(doc_id, ()):
+            if key[0] == "epoch":
+                position = bisect.bisect_left(self._epochs, (key[1], doc_id))
+                del self._epochs[position]
+                continue
+            ids = self._values[key]
+            ids.discard(doc_id)
+            if not ids:
+                del self._values[key]
+
+    def candidates(self, where: MetadataFilter) -> Set[str]:
+        """Return the ids of documents matching the filter."""
+        sets = [
+            self._values.get((field, value), set())
+            for field, operator, value in where.conditions()
+            if operator == "=="
+        ]
+        if where.after is not None or where.before is not None:
+            low = 0
+            high = len(self._epochs)
+            if where.after is not None:
+                low = bisect.bisect_left(self._epochs, (where.after,))
+            if where.before is not None:
+                high = bisect.bisect_left(self._epochs, (where.before,))
+            sets.append({doc_id for _, doc_id in self._epochs[low:high]})
+        if not sets:
+            return set(self._keys)
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
@@ -0,0 +1,43 @@
+import json
+import os
+from typing import Dict, Iterable, Iterator
+
+
+def is_jsonl(path: str) -> bool:
+    """Return True if the path uses the JSON Lines format."""
+    return path.endswith(".jsonl")
+
+
+def iter_emails(path: str) -> Iterator[Dict]:
+    """Yield emails from a JSON Lines file one at a time, or from a JSON array."""
+    with open(path, encoding="utf-8") as email_file:
+        if not is_jsonl(path):
+            yield from json.load(email_file)
+            return
+        for line in email_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_emails(path: str, emails: Iterable[Dict]) -> int:
+    """Stream emails to a temporary file, move it into place and return the count.
+
+    JSON Lines files are written one email per line. Plain ``.json`` files keep
+    the indented array layout.
+    """
+    tmp_path = f"{path}.tmp"
+    count = 0
+    with open(tmp_path, "w", encoding="utf-8") as email_file:
+        if is_jsonl(path):
+            for email in emails:
+                email_file.write(json.dumps(email, ensure_ascii=False) + "\n")
+                count += 1
+        else:
+            email_file.write("[")
+            for email in emails:
+                email_file.write(",\n" if count else "\n")
+                email_file.write(json.dumps(email, ensure_ascii=False, indent=4))
+                count += 1
+            email_file.write("\n]" if count else "]")
+    os.replace(tmp_path, path)
+    return count
@@ -0,0 +1,192 @@
+import array
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from config import (EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_MODEL,
+                    embedding_cache_path)
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that stores vectors in an on-disk SQLite cache.
+
+    Entries are keyed by model name and the SHA-256 of the text and evicted
+    least recently used first once ``max_entries`` is exceeded.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model: str,
+        cache_path: str,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        self.underlying = underlying
+        self.model = model
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model}:{digest}"
+
+    def _select(self, columns: str, keys: List[str]) -> List[tuple]:
+        rows = []
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows += self._conn.execute(
+                f"SELECT {columns} FROM embeddings WHERE key IN ({placeholders})",
+                batch,
+            ).fetchall()
+        return rows
+
+    def cached(self, texts: List[str]) -> List[bool]:
+        """Return whether each text's vector is already in the cache."""
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            found = {key for (key,) in self._select("key", keys)}
+        return [key in found for key in keys]
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        with self._lock:
+            found = {
+                key: array.array("f", blob).tolist()
+                for key, blob in self._select("key, vector", keys)
+            }
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, items: Dict[str, List[float]]):
+        now = time.time()
+        with self._lock:
+            # Only new keys grow the table; the rest are overwritten in place
+            replaced = len(self._select("key", list(items)))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) "
+                "VALUES (?, ?, ?)",
+                [
+                    (key, array.array("f", vector).tobytes(), now)
+                    for key, vector in items.items()
+                ],
+            )
+            self._size += len(items) - replaced
+            if self._size > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop the least recently used entries down to 90% of the bound."""
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._size - int(self.max_entries * 0.9)
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._size -= excess
+        logger.info(f"Evicted {excess} entries from the embedding cache")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+
+        self.hits += len(texts) - sum(1 for key in keys if key not in cached)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            cached.update(computed)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        cached = self._lookup([key])
+        if key in cached:
+            self.hits += 1
+            return cached[key]
+
+        self.misses += 1
+        vector = self.underlying.embed_query(text)
+        self._store({key: vector})
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters for this process."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._size,
+        }
+
+
+_embeddings: Optional[CachedEmbeddings] = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """Return the process-wide cached OpenAI embeddings client."""
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            # Imported on first use; langchain_openai is slow to import
+            from langchain_openai import OpenAIEmbeddings
+
+            from services.openai_client import (get_async_http_client,
+                                                get_http_client)
+
+            # The pipeline retries failed batches itself, so only the
+            # connection pool is shared
+            embeddings = OpenAIEmbeddings(
+                model=EMBEDDING_MODEL,
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client(),
+            )
+            _embeddings = CachedEmbeddings(
+                embeddings,
+                model=EMBEDDING_MODEL,
+                cache_path=embedding_cache_path,
+            )
+    return _embeddings
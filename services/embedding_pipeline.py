@@ -0,0 +1,150 @@
+import random
+import time
+from concurrent.futures import (ALL_COMPLETED, FIRST_COMPLETED,
+                                ThreadPoolExecutor, wait)
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+import tiktoken
+from langchain_core.documents import Document
+from openai import (APIConnectionError, APITimeoutError, InternalServerError,
+                    RateLimitError)
+
+from config import (EMBEDDING_BATCH_MAX_ITEMS, EMBEDDING_BATCH_MAX_TOKENS,
+                    EMBEDDING_CONCURRENCY, EMBEDDING_MAX_RETRIES,
+                    EMBEDDING_MODEL, EMBEDDING_REQUESTS_PER_MINUTE,
+                    EMBEDDING_TOKENS_PER_MINUTE)
+from logging_config import get_logger
+from services.embedding_cache import CachedEmbeddings
+from services.rate_limit import RateLimiter
+
+logger = get_logger(__name__)
+
+RETRYABLE_ERRORS = (
+    RateLimitError,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+)
+
+Chunk = Tuple[str, Document]
+Batch = List[Tuple[str, Document, int]]
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        return tiktoken.encoding_for_model(EMBEDDING_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    """Return the number of embedding model tokens in the text."""
+    return len(_encoding().encode(text, disallowed_special=()))
+
+
+def pack_batches(
+    chunks: Iterable[Chunk],
+    max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+    max_items: int = EMBEDDING_BATCH_MAX_ITEMS,
+) -> Iterator[Batch]:
+    """Group chunks into batches bounded by token count and number of inputs."""
+    batch, batch_tokens = [], 0
+    for chunk_id, doc in chunks:
+        tokens = count_tokens(doc.page_content)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append((chunk_id, doc, tokens))
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def _embed_with_retry(embeddings, texts: List[str]) -> List[List[float]]:
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        try:
+            return embeddings.embed_documents(texts)
+        except RETRYABLE_ERRORS as error:
+            if attempt == EMBEDDING_MAX_RETRIES:
+                raise
+            delay = min(60, 2**attempt) + random.uniform(0, 1)
+            logger.warning(
+                f"Embedding request failed ({error}), retrying in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+
+def _uncached_tokens(embeddings, batch: Batch) -> int:
+    """Return the tokens of the chunks that the embedding cache cannot answer."""
+    if not isinstance(embeddings, CachedEmbeddings):
+        return sum(tokens for _, _, tokens in batch)
+    cached = embeddings.cached([doc.page_content for _, doc, _ in batch])
+    return sum(tokens for (_, _, tokens), hit in zip(batch, cached) if not hit)
+
+
+def embed_chunks(
+    chunks: Iterable[Chunk],
+    embeddings,
+    write_batch: Callable[[List[str], List[Document], List[List[float]]], None],
+    total: int = None,
+    concurrency: int = EMBEDDING_CONCURRENCY,
+    requests_per_minute: int = EMBEDDING_REQUESTS_PER_MINUTE,
+    tokens_per_minute: int = EMBEDDING_TOKENS_PER_MINUTE,
+):
+    """Embed chunks concurrently within rate limits and write each finished batch.
+
+    Batches are dispatched to a pool of ``concurrency`` workers once the
+    limiter admits the request and the tokens of their uncached chunks;
+    batches the embedding cache answers in full are not charged at all. At
+    most twice ``concurrency`` batches are in flight, so the input iterable
+    is consumed lazily. ``write_batch`` is called from the calling thread as
+    batches complete, in completion order.
+    """
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    max_in_flight = concurrency * 2
+    in_flight = {}
+    done_chunks = done_tokens = 0
+    start = time.perf_counter()
+
+    def drain(return_when=None):
+        """Write finished batches, blocking per ``return_when`` if given."""
+        nonlocal done_chunks, done_tokens
+        if return_when:
+            finished, _ = wait(in_flight, return_when=return_when)
+        else:
+            finished = [future for future in in_flight if future.done()]
+        if not finished:
+            return
+        for future in finished:
+            batch = in_flight.pop(future)
+            write_batch(
+                [chunk_id for chunk_id, _, _ in batch],
+                [doc for _, doc, _ in batch],
+                future.result(),
+            )
+            done_chunks += len(batch)
+            done_tokens += sum(tokens for _, _, tokens in batch)
+
+        elapsed = time.perf_counter() - start
+        progress = f"{done_chunks}/{total}" if total else str(done_chunks)
+        logger.info(
+            f"Embedded {progress} chunks, "
+            f"{done_chunks / elapsed:.1f} chunks/s, "
+            f"{done_tokens / elapsed:.0f} tokens/s"
+        )
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for batch in pack_batches(chunks):
+            drain(FIRST_COMPLETED if len(in_flight) >= max_in_flight else None)
+            # Cache hits never reach the API, so only the misses are charged
+            uncached = _uncached_tokens(embeddings, batch)
+            if uncached:
+                limiter.acquire(uncached)
+            texts = [doc.page_content for _, doc, _ in batch]
+            in_flight[executor.submit(_embed_with_retry, embeddings, texts)] = batch
+        if in_flight:
+            drain(ALL_COMPLETED)
+
+    return done_chunks, done_tokens
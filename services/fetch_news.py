@@ -1,18 +1,21 @@
-import os
-import random
-from typing import Dict, Optional
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
 
-from dotenv import load_dotenv
-from gnews import GNews
-from openai import OpenAI
 from pydantic import BaseModel, Field
 
+from config import (NEWS_DIGEST_CONCURRENCY, NEWS_DIGEST_PER_QUERY,
+                    NEWS_DIGEST_TOPICS, NEWS_SUMMARY_REQUESTS_PER_MINUTE)
 from logging_config import get_logger
+from services.completion_cache import cached_chat_completion
+from services.news_engine import (find_article, get_articles, keyword_key,
+                                  topic_key)
+from services.rate_limit import RateLimiter
 
 logger = get_logger(__name__)
-load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Shared by every digest so parallel digests stay within one budget
+_summary_limiter = RateLimiter(NEWS_SUMMARY_REQUESTS_PER_MINUTE)
 
 
 class NewsArticle(BaseModel):
@@ -23,59 +26,47 @@ class NewsArticle(BaseModel):
     summary: str = Field(..., description="A 60-word summary of the news article")
 
 
-def _summarize_news(news_content):
+def _summarize_news(news_content, limiter: Optional[RateLimiter] = None):
     """
     Summarize the news content into 60 words using OpenAI.
+
+    An article summarized before is answered from the completion cache
+    without acquiring ``limiter``.
     """
     prompt = f"Summarize this news article in 60 words:\n\n{news_content}"
-    response = client.chat.completions.create(
+    summary = cached_chat_completion(
         model="gpt-4o",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.7,
-    )
-
-    summary = response.choices[0].message.content.strip()
+        limiter=limiter,
+    ).strip()
     return summary
 
 
+def _article_fields(topic: str, article: Dict) -> Dict[str, str]:
+    return {
+        "topic": topic,
+        "title": article["title"],
+        "content": article["description"],
+        "source": article["publisher"]["title"],
+    }
+
+
 def fetch_news_article(
     keyword: Optional[str] = None,
     language: str = "en",
     country: str = "IN",
 ) -> Optional[Dict[str, str]]:
-    google_news = GNews(language=language, country=country, max_results=1)
+    """Return the top article for a keyword, or for a random topic.
 
-    if keyword:
-        news_articles = google_news.get_news(keyword)
-        topic = keyword.upper()
-    else:
-        topics = [
-            "WORLD",
-            "SCIENCE",
-            "ECONOMY",
-            "ENERGY",
-            "VIRTUAL REALITY",
-            "ROBOTICS",
-            "NUTRITION",
-            "MENTAL HEALTH",
-            "WILDLIFE",
-            "ENVIRONMENT",
-            "NEUROSCIENCE",
-            "JOBS",
-            "FOOD",
-            "TRAVEL",
-        ]
-        topic = random.choice(topics)
-        news_articles = google_news.get_news_by_topic(topic)
-
-    if news_articles:
-        article = news_articles[0]
-        return {
-            "topic": topic,
-            "title": article["title"],
-            "content": article["description"],
-            "source": article["publisher"]["title"],
-        }
+    Articles come from the news engine's cache, which the background
+    prefetch keeps warm for the fixed topics, so a random topic is usually
+    answered without a fetch.
+    """
+    topic, article = find_article(keyword, language, country)
+
+    if article:
+        return _article_fields(topic, article)
     else:
         logger.warning(f"No news articles found for the topic/keyword: {topic}")
         return None
@@ -91,6 +82,8 @@ def fetch_summarised_news(
 
     if not article:
         raise ValueError("Failed to fetch a news article")
+    if not article["content"]:
+        raise ValueError("The news article has no description to summarize")
 
     summary_result = _summarize_news(article["content"])
 
@@ -104,3 +97,85 @@ def fetch_summarised_news(
         source=article["source"],
         summary=summary_result,
     )
+
+
+def _content_hash(article: Dict) -> str:
+    text = article.get("description") or article["title"]
+    return hashlib.sha256(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+
+def fetch_news_digest(
+    keywords: Optional[List[str]] = None,
+    topics: Optional[List[str]] = None,
+    per_query: int = NEWS_DIGEST_PER_QUERY,
+    language: str = "en",
+    country: str = "IN",
+) -> List[NewsArticle]:
+    """Fetch and summarize the top articles for several keywords and topics.
+
+    Every keyword and topic is fetched concurrently, and each article is
+    handed to a summarizer as soon as its list arrives, so a digest takes
+    about as long as its slowest article instead of the sum. Articles with
+    the same content, such as one story filed under two topics, are
+    summarized once. Summaries that miss the completion cache share
+    NEWS_SUMMARY_REQUESTS_PER_MINUTE. Without keywords or topics,
+    NEWS_DIGEST_TOPICS are used. Articles without a description, or that
+    fail to fetch or summarize, are left out.
+    """
+    queries = [
+        (keyword.upper(), keyword_key(keyword, language, country))
+        for keyword in keywords or []
+    ]
+    if topics or not keywords:
+        queries += [
+            (topic.upper(), topic_key(topic, language, country))
+            for topic in topics or NEWS_DIGEST_TOPICS
+        ]
+
+    seen = set()
+    summaries = {}
+    with ThreadPoolExecutor(
+        max_workers=NEWS_DIGEST_CONCURRENCY, thread_name_prefix="news-digest"
+    ) as executor:
+        fetches = {
+            executor.submit(get_articles, key): (position, label)
+            for position, (label, key) in enumerate(queries)
+        }
+        for fetch in as_completed(fetches):
+            position, label = fetches[fetch]
+            try:
+                articles = fetch.result()[:per_query]
+            except Exception as e:
+                logger.warning(f"Fetching news for {label} failed: {e}")
+                continue
+            for rank, article in enumerate(articles):
+                # Without a description there is nothing to summarize
+                if not article.get("description"):
+                    continue
+                content_hash = _content_hash(article)
+                if content_hash in seen:
+                    continue
+                seen.add(content_hash)
+                summary = executor.submit(
+                    _summarize_news, article["description"], _summary_limiter
+                )
+                summaries[(position, rank)] = (label, article, summary)
+
+    digest = []
+    # Keep the order of the queries and of the articles within each
+    for position in sorted(summaries):
+        label, article, summary = summaries[position]
+        try:
+            summary_text = summary.result()
+        except Exception as e:
+            logger.warning(f"Summarizing '{article['title']}' failed: {e}")
+            continue
+        digest.append(
+            NewsArticle(**_article_fields(label, article), summary=summary_text)
+        )
+
+    logger.info(
+        f"News digest: {len(digest)} articles from {len(queries)} queries, "
+        f"{len(seen)} unique"
+    )
+    return digest
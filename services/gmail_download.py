@@ -2,11 +2,257 @@ import json
 import os
 
 from logging_config import get_logger
-from services.gmail_search import search_gmail_service
+from services.email_store import is_jsonl, iter_emails, write_emails
+from services.gmail_search import (fetch_emails_by_ids, get_history_id,
+                                   iter_gmail_pages, list_history_changes,
+                                   list_message_ids)
 
 logger = get_logger(__name__)
 
 
+def _build_query(labels, query):
+    """Return the Gmail query for an explicit query or a list of labels."""
+    return query if query else " OR ".join(labels)
+
+
+def sync_state_path(download_json_file_path):
+    """Return the path of the sync state file stored next to the JSON file."""
+    return f"{os.path.splitext(download_json_file_path)[0]}.sync.json"
+
+
+def _write_json_atomic(path, data, **kwargs):
+    """Write JSON to a temporary file and move it into place."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as json_file:
+        json.dump(data, json_file, ensure_ascii=False, **kwargs)
+    os.replace(tmp_path, path)
+
+
+def _load_sync_state(state_path):
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, encoding="utf-8") as state_file:
+        return json.load(state_file)
+
+
+def download_checkpoint_path(download_json_file_path):
+    """Return the path of the checkpoint kept while a download is running."""
+    return f"{os.path.splitext(download_json_file_path)[0]}.download.json"
+
+
+def _partial_path(download_json_file_path):
+    return f"{os.path.splitext(download_json_file_path)[0]}.partial.jsonl"
+
+
+def _download_resumable(query, max_results, download_json_file_path):
+    """Download matching emails page by page, resuming an interrupted run.
+
+    Each page is appended to a ``.partial.jsonl`` file and flushed to disk,
+    then the checkpoint next to it is atomically rewritten with the next
+    page token, the ids done so far and the file size. A rerun with the same
+    query truncates the partial file to that size and continues from the
+    saved page token. Messages that keep failing after the per-message
+    retries are recorded and retried once at the end instead of aborting
+    the run. Once every page is done the partial file is moved into place.
+
+    Returns ``(count, email_ids, history_id)``, where ``history_id`` was read
+    before the first page of the original run.
+    """
+    checkpoint_path = download_checkpoint_path(download_json_file_path)
+    partial_path = _partial_path(download_json_file_path)
+    checkpoint = _load_sync_state(checkpoint_path)
+
+    if (
+        checkpoint
+        and checkpoint["query"] == query
+        and checkpoint["max_results"] == max_results
+        and os.path.exists(partial_path)
+    ):
+        logger.info(
+            f"Resuming download after {len(checkpoint['done_ids'])} emails "
+            f"with query: {query}"
+        )
+    else:
+        # Read the historyId first so changes made during the download are
+        # picked up again by the next incremental run
+        checkpoint = {
+            "query": query,
+            "max_results": max_results,
+            "history_id": get_history_id(),
+            "page_token": None,
+            "done_ids": [],
+            "failed_ids": [],
+            "size": 0,
+            "complete": False,
+        }
+        logger.info(f"Downloading emails with query: {query}")
+
+    done_ids = checkpoint["done_ids"]
+    done = set(done_ids)
+    failed_ids = set(checkpoint["failed_ids"])
+
+    with open(partial_path, "a+b") as partial_file:
+        # Drop anything written after the last checkpoint
+        partial_file.truncate(checkpoint["size"])
+
+        def save_page(emails):
+            for email in emails:
+                failed_ids.discard(email["id"])
+                # Pages can overlap when mail arrives during the download
+                if email["id"] in done:
+                    continue
+                line = json.dumps(email, ensure_ascii=False) + "\n"
+                partial_file.write(line.encode("utf-8"))
+                done_ids.append(email["id"])
+                done.add(email["id"])
+            partial_file.flush()
+            os.fsync(partial_file.fileno())
+            checkpoint["size"] = partial_file.tell()
+
+        def save_checkpoint():
+            checkpoint["failed_ids"] = sorted(failed_ids)
+            _write_json_atomic(checkpoint_path, checkpoint)
+
+        if not checkpoint["complete"]:
+            remaining = max_results - len(done_ids) - len(failed_ids)
+            pages = iter_gmail_pages(
+                query,
+                max_results=remaining,
+                page_token=checkpoint["page_token"],
+                skip_failed=True,
+            )
+            for emails, next_page_token, failed in pages:
+                save_page(emails)
+                failed_ids.update(failed)
+                checkpoint["page_token"] = next_page_token
+                checkpoint["complete"] = not next_page_token
+                save_checkpoint()
+                logger.info(
+                    f"Downloaded {len(done_ids)} emails, {len(failed_ids)} failed"
+                )
+            checkpoint["complete"] = True
+            save_checkpoint()
+
+        if failed_ids:
+            logger.info(f"Retrying {len(failed_ids)} failed emails")
+            still_failed = set()
+            save_page(fetch_emails_by_ids(sorted(failed_ids), failed=still_failed))
+            # Messages deleted in the meantime are neither fetched nor failed
+            failed_ids = still_failed
+            save_checkpoint()
+
+    if failed_ids:
+        logger.warning(
+            f"{len(failed_ids)} emails could not be downloaded and are left out"
+        )
+
+    if is_jsonl(download_json_file_path):
+        os.replace(partial_path, download_json_file_path)
+    else:
+        write_emails(download_json_file_path, iter_emails(partial_path))
+        os.remove(partial_path)
+    os.remove(checkpoint_path)
+    return len(done_ids), done_ids, checkpoint["history_id"]
+
+
+def _full_sync(query, max_results, download_json_file_path, state_path):
+    """Download every matching email and record a fresh sync checkpoint."""
+    logger.info(f"Full sync with query: {query}")
+    count, email_ids, history_id = _download_resumable(
+        query, max_results, download_json_file_path
+    )
+    # Emails left out after failing are not in the manifest, so the next
+    # incremental sync fetches them
+    manifest = {email_id: history_id for email_id in email_ids}
+    _write_json_atomic(
+        state_path,
+        {"query": query, "history_id": history_id, "manifest": manifest},
+    )
+    logger.info(f"Saved {count} cleaned emails to {download_json_file_path}")
+
+
+def sync_emails_to_json(
+    labels=[
+        "label:inbox",
+        "label:starred",
+        "label:important",
+    ],
+    query=None,
+    max_results=10,
+    download_json_file_path=None,
+):
+    """Bring the JSON file up to date with only the changes since the last sync.
+
+    The Gmail historyId of the last sync and a manifest of the message ids in
+    the file are kept in a ``.sync.json`` file next to it. Messages added or
+    relabelled since then are fetched, deleted ones dropped, and the rest of
+    the file is left untouched.
+    """
+    query = _build_query(labels, query)
+    state_path = sync_state_path(download_json_file_path)
+    state = _load_sync_state(state_path)
+
+    if (
+        state is None
+        or state.get("query") != query
+        or not os.path.exists(download_json_file_path)
+    ):
+        _full_sync(query, max_results, download_json_file_path, state_path)
+        return
+
+    changes = list_history_changes(state["history_id"])
+    if changes is None:
+        logger.info("Gmail history expired. Falling back to a full sync.")
+        _full_sync(query, max_results, download_json_file_path, state_path)
+        return
+
+    changed_ids, deleted_ids, history_id = changes
+    manifest = state["manifest"]
+
+    if not changed_ids and not deleted_ids:
+        logger.info("No mailbox changes since the last sync.")
+        state["history_id"] = history_id
+        _write_json_atomic(state_path, state)
+        return
+
+    # The history feed is mailbox-wide, so re-list the ids matching the query
+    # to decide which changed messages belong in the file
+    matching_ids = list_message_ids(query, max_results)
+    matching = set(matching_ids)
+    to_fetch = [
+        msg_id
+        for msg_id in matching_ids
+        if msg_id not in manifest or msg_id in changed_ids
+    ]
+    removed = {
+        msg_id for msg_id in manifest if msg_id not in matching or msg_id in deleted_ids
+    }
+
+    fetched = fetch_emails_by_ids(to_fetch)
+    fetched_ids = {email["id"] for email in fetched}
+
+    def merged():
+        # Fetched emails replace their old copies; the rest of the file is
+        # streamed through unchanged
+        yield from fetched
+        for email in iter_emails(download_json_file_path):
+            if email["id"] not in removed and email["id"] not in fetched_ids:
+                yield email
+
+    count = write_emails(download_json_file_path, merged())
+    for msg_id in removed:
+        manifest.pop(msg_id, None)
+    for msg_id in fetched_ids:
+        manifest[msg_id] = history_id
+    state["history_id"] = history_id
+    _write_json_atomic(state_path, state)
+
+    logger.info(
+        f"Incremental sync: {len(fetched)} fetched, {len(removed)} removed, "
+        f"{count} emails in {download_json_file_path}"
+    )
+
+
 def fetch_emails_to_json(
     labels=[
         "label:inbox",
@@ -16,27 +262,27 @@ def fetch_emails_to_json(
     query=None,
     max_results=10,
     download_json_file_path=None,
+    incremental=False,
 ):
-    """Fetch emails using the Gmail tool for multiple labels or query and save them to a JSON file."""
-    if not os.path.exists(download_json_file_path):
-        all_emails = []
-
-        if query:
-            logger.info(f"Fetching emails with query: {query}")
-            emails = search_gmail_service(query=query, max_results=max_results)
-            all_emails.extend(emails)
-        else:
-            combined_query = " OR ".join(labels)
-            logger.info(f"Fetching emails with combined query: {combined_query}")
-            emails = search_gmail_service(query=combined_query, max_results=max_results)
-            all_emails.extend(emails)
-
-        # Save all cleaned emails to JSON
-        logger.info(f"Saving {len(all_emails)} emails to {download_json_file_path}...")
-        with open(download_json_file_path, "w", encoding="utf-8") as json_file:
-            json.dump(all_emails, json_file, ensure_ascii=False, indent=4)
-        logger.info(
-            f"Saved {len(all_emails)} cleaned emails to {download_json_file_path}"
+    """Fetch emails using the Gmail tool for multiple labels or query and save them to a JSON file.
+
+    Emails are checkpointed to disk page by page as they arrive, so an
+    interrupted download resumes where it stopped on the next call. A
+    ``.jsonl`` path keeps the JSON Lines file, a ``.json`` path gets the
+    indented array layout.
+    """
+    if incremental:
+        sync_emails_to_json(
+            labels=labels,
+            query=query,
+            max_results=max_results,
+            download_json_file_path=download_json_file_path,
+        )
+    elif not os.path.exists(download_json_file_path):
+        combined_query = _build_query(labels, query)
+        count, _, _ = _download_resumable(
+            combined_query, max_results, download_json_file_path
         )
+        logger.info(f"Saved {count} cleaned emails to {download_json_file_path}")
     else:
         logger.info("JSON file already exists. Skipping email fetch.")
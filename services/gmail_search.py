@@ -1,107 +1,507 @@
 import base64
 import os
-import re
+import random
+import threading
 import time
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from bs4 import BeautifulSoup
+import httplib2
+from cachetools import LRUCache
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from config import (BODY_CACHE_SIZE, GMAIL_BACKOFF_BASE, GMAIL_BATCH_SIZE,
+                    GMAIL_MAX_RETRIES, LABEL_CACHE_TTL)
+from logging_config import get_logger
+from services.email_cleaner import clean_email_bodies, clean_email_body
+from services.email_metadata import TIMESTAMP_FORMAT
+
+logger = get_logger(__name__)
 
 # If modifying these SCOPES, delete the token.json file
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
+METADATA_HEADERS = ["Subject", "From"]
+
+
+_credentials = None
+_credentials_lock = threading.Lock()
+_thread_local = threading.local()
+_label_mapping = None
+_label_mapping_expires = 0.0
+_label_mapping_lock = threading.Lock()
+_body_cache = LRUCache(maxsize=BODY_CACHE_SIZE)
+_body_cache_lock = threading.Lock()
+
+
+class GmailSearchError(RuntimeError):
+    """Raised when searching or downloading from Gmail fails."""
+
+
+def _get_credentials():
+    """Return process-wide Gmail credentials, refreshing them once expired."""
+    global _credentials
+    with _credentials_lock:
+        creds = _credentials
+        # Check if token.json exists for saved credentials
+        if creds is None and os.path.exists("token.json"):
+            creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+        # If no valid credentials, authenticate
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    "credentials.json", SCOPES
+                )
+                creds = flow.run_local_server(port=0)
+            # Save the credentials for future use
+            with open("token.json", "w") as token:
+                token.write(creds.to_json())
+        _credentials = creds
+        return creds
 
 
 def _authenticate_gmail():
-    """Authenticate and return the Gmail API service."""
-    creds = None
-    # Check if token.json exists for saved credentials
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-    # If no valid credentials, authenticate
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for future use
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
-
-    # Build the Gmail API service
-    return build("gmail", "v1", credentials=creds)
+    """Authenticate and return the Gmail API service.
 
+    Credentials are shared by the whole process. The service object is built
+    once per thread because its HTTP transport is not thread-safe; it holds
+    the shared credentials, so a refresh is picked up without a rebuild.
+    """
+    creds = _get_credentials()
+    service = getattr(_thread_local, "service", None)
+    if service is None:
+        # Build the Gmail API service
+        service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+        _thread_local.service = service
+    return service
 
-def _clean_email_body(body: str) -> str:
-    soup = BeautifulSoup(body, "html.parser")
 
-    # Remove script and style elements
-    for script in soup(["script", "style"]):
-        script.decompose()
+def warm_gmail_service() -> bool:
+    """Load saved credentials and build this thread's Gmail service early.
 
-    # Remove signature (assuming it's in a div with class 'signature')
-    signature = soup.find("div", class_="signature")
-    if signature:
-        signature.decompose()
+    Returns False without starting the browser sign-in when no token has
+    been saved yet.
+    """
+    if not os.path.exists("token.json"):
+        return False
+    _authenticate_gmail()
+    return True
 
-    # Get text
-    text = soup.get_text()
 
-    # Replace multiple newlines (\n) with a single newline
-    text = re.sub(r"\n+", "\n", text)
-
-    # Replace multiple newlines (\n) with a single newline
-    text = re.sub(r"\r+", "\r", text)
+def _get_label_mapping():
+    """Fetch label mapping (name to ID and ID to name) from Gmail API.
 
-    # Replace multiple spaces with a single space
-    text = re.sub(r"\s+", " ", text)
+    The mapping is cached for ``LABEL_CACHE_TTL`` seconds.
+    """
+    global _label_mapping, _label_mapping_expires
+    with _label_mapping_lock:
+        if _label_mapping is not None and time.monotonic() < _label_mapping_expires:
+            return _label_mapping
 
-    # Break into lines and remove leading and trailing space on each
-    lines = (line.strip() for line in text.splitlines())
+    service = _authenticate_gmail()
+    results = service.users().labels().list(userId="me").execute()
+    labels = results.get("labels", [])
+    label_name_to_id = {label["name"]: label["id"] for label in labels}
+    label_id_to_name = {label["id"]: label["name"] for label in labels}
 
-    # Break multi-headlines into a line each
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    with _label_mapping_lock:
+        _label_mapping = (label_name_to_id, label_id_to_name)
+        _label_mapping_expires = time.monotonic() + LABEL_CACHE_TTL
+    return _label_mapping
 
-    # Drop blank lines and join the rest
-    text = "\n".join(chunk for chunk in chunks if chunk)
 
-    # Remove non-printable characters
-    text = re.sub(r"[^\x20-\x7E\n]", "", text)
+def _decode_part(part) -> str:
+    data = part.get("body", {}).get("data", "")
+    return base64.urlsafe_b64decode(data).decode("utf-8", errors="replace")
 
-    return text.strip()
 
+def _preferred_alternative(parts):
+    """Pick the richest part of a multipart/alternative.
 
-def _get_label_mapping():
-    """Fetch label mapping (name to ID and ID to name) from Gmail API."""
-    service = _authenticate_gmail()
-    results = service.users().labels().list(userId="me").execute()
-    labels = results.get("labels", [])
-    label_name_to_id = {label["name"]: label["id"] for label in labels}
-    label_id_to_name = {label["id"]: label["name"] for label in labels}
-    return label_name_to_id, label_id_to_name
+    HTML wins over a nested multipart, such as multipart/related holding
+    the HTML and its images, which wins over plain text.
+    """
+    preferred, preferred_rank = None, 0
+    for part in parts:
+        mime_type = part.get("mimeType", "")
+        if mime_type == "text/html":
+            rank = 3
+        elif mime_type.startswith("multipart/"):
+            rank = 2
+        elif mime_type == "text/plain":
+            rank = 1
+        else:
+            continue
+        # Alternatives are ordered by increasing preference, so the last wins
+        if rank >= preferred_rank:
+            preferred, preferred_rank = part, rank
+    return preferred
 
 
 def _parse_parts(parts):
     body = ""
     for part in parts:
-        if part.get("mimeType") == "text/plain":
-            body += base64.urlsafe_b64decode(part["body"].get("data", "")).decode(
-                "utf-8"
-            )
-        elif part.get("mimeType") == "text/html":
-            body += base64.urlsafe_b64decode(part["body"].get("data", "")).decode(
-                "utf-8"
-            )
-        elif part.get("mimeType", "").startswith("multipart/"):
+        mime_type = part.get("mimeType", "")
+        if mime_type in ("text/plain", "text/html"):
+            body += _decode_part(part)
+        elif mime_type == "multipart/alternative":
+            # The alternatives carry the same content, so only one is kept
+            preferred = _preferred_alternative(part.get("parts", []))
+            if preferred:
+                body += _parse_parts([preferred])
+        elif mime_type.startswith("multipart/"):
             body += _parse_parts(part.get("parts", []))
     return body
 
 
-def search_gmail_service(query: str, max_results: int = 5) -> List[Dict[str, str]]:
-    """Search Gmail for the top relevant emails matching the query."""
+def _is_retryable(error: Exception) -> bool:
+    """Return True if the error is a rate limit, transient server or network error."""
+    # httplib2 raises ServerNotFoundError when DNS resolution fails
+    if isinstance(error, (ConnectionError, TimeoutError, httplib2.ServerNotFoundError)):
+        return True
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status in (429, 500, 502, 503, 504):
+        return True
+    # Gmail reports per-user quota exhaustion as 403 rateLimitExceeded
+    return status == 403 and "ratelimitexceeded" in str(error).lower()
+
+
+def _error_reason(error: Exception) -> str:
+    """Describe a retryable error by its HTTP status or exception type."""
+    if isinstance(error, HttpError):
+        return f"HTTP {error.resp.status}"
+    return type(error).__name__
+
+
+def _backoff(attempt: int, reasons: Iterable[str]):
+    """Sleep with exponential backoff and jitter before the next retry."""
+    delay = GMAIL_BACKOFF_BASE * (2**attempt) + random.uniform(0, 1)
+    logger.warning(
+        f"Gmail request failed ({', '.join(sorted(set(reasons)))}), "
+        f"retrying in {delay:.1f}s"
+    )
+    time.sleep(delay)
+
+
+def _execute(request):
+    """Execute a single API request, retrying rate limits and transient errors."""
+    for attempt in range(GMAIL_MAX_RETRIES + 1):
+        try:
+            return request.execute()
+        except Exception as error:
+            if not _is_retryable(error) or attempt == GMAIL_MAX_RETRIES:
+                raise
+            _backoff(attempt, [_error_reason(error)])
+
+
+def _fetch_messages(
+    service,
+    msg_ids: List[str],
+    format: str = "full",
+    skip_missing: bool = False,
+    failed: Optional[Set[str]] = None,
+) -> Dict:
+    """Fetch messages in Gmail batch requests, retrying rate-limited ones.
+
+    ``format="metadata"`` fetches only the headers the email dict needs.
+
+    With ``skip_missing`` messages deleted in the meantime (404) are left out
+    of the result instead of failing the whole fetch. When a ``failed`` set
+    is passed, messages that still fail after the retries are added to it
+    and left out instead of raising.
+    """
+    messages = {}
+    pending = list(msg_ids)
+
+    for attempt in range(GMAIL_MAX_RETRIES + 1):
+        retry = []
+        reasons = []
+        errors = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                messages[request_id] = response
+            elif _is_retryable(exception):
+                retry.append(request_id)
+                reasons.append(_error_reason(exception))
+            elif (
+                skip_missing
+                and isinstance(exception, HttpError)
+                and exception.resp.status == 404
+            ):
+                logger.info(f"Message {request_id} no longer exists, skipping")
+            elif failed is not None:
+                logger.warning(f"Fetching message {request_id} failed: {exception}")
+                failed.add(request_id)
+            else:
+                errors.append(exception)
+
+        for start in range(0, len(pending), GMAIL_BATCH_SIZE):
+            chunk = pending[start : start + GMAIL_BATCH_SIZE]
+            batch = service.new_batch_http_request(callback=callback)
+            for msg_id in chunk:
+                get_kwargs = {"userId": "me", "id": msg_id, "format": format}
+                if format == "metadata":
+                    get_kwargs["metadataHeaders"] = METADATA_HEADERS
+                request = service.users().messages().get(**get_kwargs)
+                batch.add(request, request_id=msg_id)
+            try:
+                batch.execute()
+            except Exception as error:
+                if not _is_retryable(error):
+                    raise
+                retry.extend(msg_id for msg_id in chunk if msg_id not in messages)
+                reasons.append(_error_reason(error))
+
+        if errors:
+            raise errors[0]
+        if not retry:
+            break
+        if attempt == GMAIL_MAX_RETRIES:
+            if failed is None:
+                raise GmailSearchError(
+                    f"Gave up fetching {len(retry)} messages after retries"
+                )
+            logger.warning(f"Gave up fetching {len(retry)} messages after retries")
+            failed.update(retry)
+            break
+
+        _backoff(attempt, reasons)
+        pending = retry
+
+    return messages
+
+
+def _parse_headers(msg_data: Dict, label_id_to_name: Dict) -> Dict[str, str]:
+    """Return the email dict fields that come from headers and message metadata."""
+    payload = msg_data.get("payload", {})
+    headers = payload.get("headers", [])
+    subject = next(
+        (header["value"] for header in headers if header["name"].lower() == "subject"),
+        "No Subject",
+    )
+    sender = next(
+        (header["value"] for header in headers if header["name"].lower() == "from"),
+        "Unknown Sender",
+    )
+    timestamp = int(msg_data.get("internalDate", 0)) // 1000
+    labels = [
+        label_id_to_name.get(label, label) for label in msg_data.get("labelIds", [])
+    ]
+
+    return {
+        "id": msg_data["id"],
+        "threadId": msg_data.get("threadId"),
+        "subject": subject,
+        "from": sender,
+        "timestamp": time.strftime(TIMESTAMP_FORMAT, time.localtime(timestamp)),
+        "epoch": timestamp,
+        "labels": labels,
+    }
+
+
+def _parse_message(
+    msg_data: Dict, label_id_to_name: Dict, clean: bool = True
+) -> Dict[str, str]:
+    """Convert a Gmail API message resource into the email dict.
+
+    With ``clean=False`` the raw body is returned so callers can clean a
+    whole page at once with ``clean_email_bodies``.
+    """
+    email = _parse_headers(msg_data, label_id_to_name)
+    body = _parse_parts([msg_data.get("payload", {})])
+    email["body"] = clean_email_body(body) if clean else body
+    return email
+
+
+def get_history_id() -> str:
+    """Return the mailbox's current historyId."""
+    service = _authenticate_gmail()
+    return service.users().getProfile(userId="me").execute()["historyId"]
+
+
+def list_message_ids(query: str, max_results: int = 5) -> List[str]:
+    """List the ids of messages matching the query without fetching them."""
+    service = _authenticate_gmail()
+    msg_ids = []
+    next_page_token = None
+
+    while len(msg_ids) < max_results:
+        results = _execute(
+            service.users()
+            .messages()
+            .list(
+                userId="me",
+                q=query,
+                maxResults=min(max_results - len(msg_ids), 500),
+                pageToken=next_page_token,
+            )
+        )
+        msg_ids.extend(msg["id"] for msg in results.get("messages", []))
+        next_page_token = results.get("nextPageToken")
+        if not next_page_token:
+            break
+
+    return msg_ids
+
+
+def list_history_changes(
+    start_history_id: str,
+) -> Optional[Tuple[Set[str], Set[str], str]]:
+    """List message ids changed and deleted since ``start_history_id``.
+
+    Returns ``(changed_ids, deleted_ids, latest_history_id)``, or None when
+    Gmail no longer has history that far back and a full sync is needed.
+    """
+    service = _authenticate_gmail()
+    changed_ids, deleted_ids = set(), set()
+    latest_history_id = start_history_id
+    next_page_token = None
+
+    while True:
+        try:
+            results = _execute(
+                service.users()
+                .history()
+                .list(
+                    userId="me",
+                    startHistoryId=start_history_id,
+                    pageToken=next_page_token,
+                )
+            )
+        except HttpError as error:
+            if error.resp.status == 404:
+                return None
+            raise
+
+        for record in results.get("history", []):
+            for key in ("messagesAdded", "labelsAdded", "labelsRemoved"):
+                changed_ids.update(
+                    item["message"]["id"] for item in record.get(key, [])
+                )
+            deleted_ids.update(
+                item["message"]["id"] for item in record.get("messagesDeleted", [])
+            )
+
+        latest_history_id = results.get("historyId", latest_history_id)
+        next_page_token = results.get("nextPageToken")
+        if not next_page_token:
+            break
+
+    return changed_ids - deleted_ids, deleted_ids, latest_history_id
+
+
+def fetch_emails_by_ids(
+    msg_ids: Iterable[str], failed: Optional[Set[str]] = None
+) -> List[Dict[str, str]]:
+    """Fetch and clean the given messages, skipping ones that no longer exist.
+
+    When a ``failed`` set is passed, messages that keep failing after the
+    retries are added to it instead of raising.
+    """
+    service = _authenticate_gmail()
+    _, label_id_to_name = _get_label_mapping()
+    msg_ids = list(msg_ids)
+    msg_data_by_id = _fetch_messages(service, msg_ids, skip_missing=True, failed=failed)
+    return [
+        _parse_message(msg_data_by_id[msg_id], label_id_to_name)
+        for msg_id in msg_ids
+        if msg_id in msg_data_by_id
+    ]
+
+
+def get_email_bodies(msg_ids: Iterable[str]) -> Dict[str, str]:
+    """Return cleaned bodies by message id, fetching only ones not cached yet."""
+    msg_ids = list(dict.fromkeys(msg_ids))
+    with _body_cache_lock:
+        bodies = {
+            msg_id: _body_cache[msg_id] for msg_id in msg_ids if msg_id in _body_cache
+        }
+
+    missing = [msg_id for msg_id in msg_ids if msg_id not in bodies]
+    if missing:
+        service = _authenticate_gmail()
+        msg_data_by_id = _fetch_messages(service, missing, skip_missing=True)
+        fetched = {
+            msg_id: clean_email_body(_parse_parts([msg_data.get("payload", {})]))
+            for msg_id, msg_data in msg_data_by_id.items()
+        }
+        with _body_cache_lock:
+            _body_cache.update(fetched)
+        bodies.update(fetched)
+
+    return bodies
+
+
+def get_email_body(msg_id: str) -> Dict[str, str]:
+    """Return the cleaned body of a single email by its message id."""
+    body = get_email_bodies([msg_id]).get(msg_id)
+    if body is None:
+        return {"id": msg_id, "error": "Message not found"}
+    return {"id": msg_id, "body": body}
+
+
+def search_gmail_metadata(
+    query: str, max_results: int = 5, hydrate_top: int = 0
+) -> List[Dict[str, str]]:
+    """Search Gmail returning headers and snippets instead of full bodies.
+
+    Messages are fetched with ``format="metadata"``. Only the first
+    ``hydrate_top`` hits get a ``body``; the rest can be hydrated on demand
+    with ``get_email_body``.
+    """
+    service = _authenticate_gmail()
+
+    try:
+        _, label_id_to_name = _get_label_mapping()
+        msg_ids = list_message_ids(query, max_results)
+        msg_data_by_id = _fetch_messages(
+            service, msg_ids, format="metadata", skip_missing=True
+        )
+
+        emails = []
+        for msg_id in msg_ids:
+            # Deleted between listing and fetching
+            msg_data = msg_data_by_id.get(msg_id)
+            if msg_data is None:
+                continue
+            email = _parse_headers(msg_data, label_id_to_name)
+            email["snippet"] = msg_data.get("snippet", "")
+            emails.append(email)
+
+        bodies = get_email_bodies(email["id"] for email in emails[:hydrate_top])
+        for email in emails[:hydrate_top]:
+            if email["id"] in bodies:
+                email["body"] = bodies[email["id"]]
+
+        return emails
+
+    except Exception as error:
+        raise GmailSearchError(f"An error occurred: {error}") from error
+
+
+def iter_gmail_pages(
+    query: str,
+    max_results: int = 5,
+    page_token: Optional[str] = None,
+    batched: bool = True,
+    skip_failed: bool = False,
+) -> Iterator[Tuple[List[Dict[str, str]], Optional[str], Set[str]]]:
+    """Yield ``(emails, next_page_token, failed_ids)`` for each result page.
+
+    Listing starts at ``page_token``, so a download can resume from the
+    token of the last page it saved. With ``batched`` the message bodies of
+    each page are fetched through Gmail batch requests instead of one HTTP
+    round trip per message. With ``skip_failed`` messages that keep failing
+    after the retries are reported in ``failed_ids`` instead of ending the
+    search. Only the current page is held in memory.
+    """
     service = _authenticate_gmail()
 
     try:
@@ -109,14 +509,14 @@ def search_gmail_service(query: str, max_results: int = 5) -> List[Dict[str, str
         _, label_id_to_name = _get_label_mapping()
 
         # Search for emails with pagination
-        emails = []
-        next_page_token = None
+        listed = 0
+        next_page_token = page_token
 
-        while len(emails) < max_results:
+        while listed < max_results:
             # Limit the number of results per API call to 500
-            page_results = min(max_results - len(emails), 500)
+            page_results = min(max_results - listed, 500)
 
-            results = (
+            results = _execute(
                 service.users()
                 .messages()
                 .list(
@@ -125,63 +525,64 @@ def search_gmail_service(query: str, max_results: int = 5) -> List[Dict[str, str
                     maxResults=page_results,
                     pageToken=next_page_token,
                 )
-                .execute()
             )
             messages = results.get("messages", [])
             next_page_token = results.get("nextPageToken")
+            msg_ids = [msg["id"] for msg in messages]
+            listed += len(msg_ids)
+            failed = set()
 
             # Fetch details for each email
-            for msg in messages:
-                msg_id = msg["id"]
-                msg_data = (
-                    service.users()
-                    .messages()
-                    .get(userId="me", id=msg_id, format="full")
-                    .execute()
-                )
-                payload = msg_data.get("payload", {})
-                headers = payload.get("headers", [])
-                subject = next(
-                    (
-                        header["value"]
-                        for header in headers
-                        if header["name"].lower() == "subject"
-                    ),
-                    "No Subject",
+            if batched:
+                msg_data_by_id = _fetch_messages(
+                    service,
+                    msg_ids,
+                    skip_missing=skip_failed,
+                    failed=failed if skip_failed else None,
                 )
-                sender = next(
-                    (
-                        header["value"]
-                        for header in headers
-                        if header["name"].lower() == "from"
-                    ),
-                    "Unknown Sender",
-                )
-                timestamp = int(msg_data.get("internalDate", 0)) // 1000
-                labels = [
-                    label_id_to_name.get(label, label)
-                    for label in msg_data.get("labelIds", [])
+                page = [
+                    msg_data_by_id[msg_id]
+                    for msg_id in msg_ids
+                    if msg_id in msg_data_by_id
+                ]
+            else:
+                page = [
+                    _execute(
+                        service.users()
+                        .messages()
+                        .get(userId="me", id=msg_id, format="full")
+                    )
+                    for msg_id in msg_ids
                 ]
 
-                body = _parse_parts([payload])
-
-                emails.append(
-                    {
-                        "id": msg_id,
-                        "subject": subject,
-                        "from": sender,
-                        "timestamp": time.strftime(
-                            "%Y, %b %d, %I:%M%p", time.localtime(timestamp)
-                        ),
-                        "labels": labels,
-                        "body": _clean_email_body(body),
-                    }
-                )
+            emails = [
+                _parse_message(msg_data, label_id_to_name, clean=False)
+                for msg_data in page
+            ]
+            bodies = clean_email_bodies([email["body"] for email in emails])
+            for email, body in zip(emails, bodies):
+                email["body"] = body
+            yield emails, next_page_token, failed
 
-            if not next_page_token:
+            if not next_page_token or not msg_ids:
                 break
 
-        return emails
-
+    except GmailSearchError:
+        raise
     except Exception as error:
-        raise RuntimeError(f"An error occurred: {error}")
+        raise GmailSearchError(f"An error occurred: {error}") from error
+
+
+def iter_gmail_service(
+    query: str, max_results: int = 5, batched: bool = True
+) -> Iterator[Dict[str, str]]:
+    """Yield emails matching the query, fetching one result page at a time."""
+    for emails, _, _ in iter_gmail_pages(query, max_results, batched=batched):
+        yield from emails
+
+
+def search_gmail_service(
+    query: str, max_results: int = 5, batched: bool = True
+) -> List[Dict[str, str]]:
+    """Search Gmail for the top relevant emails matching the query."""
+    return list(iter_gmail_service(query, max_results=max_results, batched=batched))
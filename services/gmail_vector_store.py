@@ -1,59 +1,97 @@
-import os
+import hashlib
+import json
+import time
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import JSONLoader
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
 
-from config import EMBEDDING_MODEL
 from logging_config import get_logger
+from services.email_chunker import ThreadDedupChunker
+from services.embedding_cache import get_embeddings
+from services.embedding_pipeline import embed_chunks
+from services.vector_backends import get_vector_backend, store_version_path
 
 logger = get_logger(__name__)
 
+UPSERT_BATCH_SIZE = 500
 
-def initialize_vector_store(json_file_path, persistent_directory):
-    """Create a vector store if it does not already exist."""
-    if not os.path.exists(persistent_directory):
-        logger.info("Persistent directory does not exist. Initializing vector store...")
 
-        # Define the jq schema to parse JSON
-        jq_schema = ".[] | {page_content: .body, metadata: {subject: .subject, from: .from, timestamp: .timestamp, labels: .labels}}"
+def chunk_id(msg_id, index, content, metadata=None):
+    """Return a stable chunk id built from message id, position and content.
 
-        # Load the JSON file using JSONLoader with `text_content=False`
-        loader = JSONLoader(
-            file_path=json_file_path, jq_schema=jq_schema, text_content=False
-        )
-        documents = loader.load()
+    The metadata is part of the hash, so relabelled emails are rewritten
+    with their new labels; their embeddings come from the embedding cache.
+    """
+    if metadata is not None:
+        content += "\n" + json.dumps(metadata, sort_keys=True)
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    return f"{msg_id}:{index}:{digest}"
 
-        # Ensure all `page_content` fields are strings
-        for doc in documents:
-            if not isinstance(doc.page_content, str):
-                doc.page_content = str(doc.page_content)
 
-        # Split the document into chunks based on 1000 tokens or smaller
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=100
-        )
-        docs = text_splitter.split_documents(documents)
-
-        # Display information about the split documents
-        logger.info("\n--- Document Chunks Information ---")
-        logger.info(f"Number of document chunks: {len(docs)}")
-        logger.info(f"Sample chunk:\n{docs[0].page_content}\n")
-
-        # Create embeddings using OpenAI
-        logger.info("\n--- Creating embeddings ---")
-        embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
-        logger.info("\n--- Finished creating embeddings ---")
-
-        # Create the vector store and persist it automatically
-        logger.info("\n--- Creating vector store ---")
-        db = Chroma.from_documents(
-            docs, embeddings, persist_directory=persistent_directory
-        )
-        logger.info(
-            f"\n--- Finished creating vector store at {persistent_directory} ---"
+def _mark_store_updated(persistent_directory):
+    with open(store_version_path(persistent_directory), "w") as marker:
+        marker.write(str(time.time()))
+
+
+def _iter_chunks(json_file_path, chunker):
+    """Yield the chunks to store with their stable ids."""
+    for msg_id, index, chunk in chunker.iter_chunks(json_file_path):
+        yield chunk_id(msg_id, index, chunk.page_content, chunk.metadata), chunk
+
+
+def initialize_vector_store(json_file_path, persistent_directory, backend=None):
+    """Create the vector store or bring it in line with the emails file.
+
+    ``backend`` picks the storage from ``services.vector_backends`` and
+    defaults to VECTOR_BACKEND.
+
+    Chunks are stored under ids derived from the message id, chunk index and
+    a content hash, so only new or changed chunks are embedded and chunks of
+    deleted or edited messages are removed. Emails are read, split and
+    embedded as a stream, so only the chunk ids of the corpus are kept in
+    memory. ``ThreadDedupChunker`` leaves out quoted replies, signatures,
+    in-thread near-duplicates and repeated boilerplate before anything is
+    embedded.
+    """
+    # Split the document into chunks based on 1000 tokens or smaller
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+    chunker = ThreadDedupChunker(text_splitter)
+
+    embeddings = get_embeddings()
+    store = get_vector_backend(persistent_directory, embeddings, backend)
+
+    existing_ids = store.existing_ids()
+    wanted_ids = set()
+
+    def new_chunks():
+        chunks = _iter_chunks(json_file_path, chunker)
+        for doc_id, doc in chunks:
+            wanted_ids.add(doc_id)
+            if doc_id not in existing_ids:
+                yield doc_id, doc
+
+    def write_batch(batch_ids, batch_docs, vectors):
+        store.upsert(
+            batch_ids,
+            [doc.page_content for doc in batch_docs],
+            [doc.metadata for doc in batch_docs],
+            vectors,
         )
 
-    else:
-        logger.info("Vector store already exists. No need to initialize.")
+    embedded, _ = embed_chunks(new_chunks(), embeddings, write_batch)
+
+    stale_ids = list(existing_ids - wanted_ids)
+    for start in range(0, len(stale_ids), UPSERT_BATCH_SIZE):
+        store.delete(stale_ids[start : start + UPSERT_BATCH_SIZE])
+
+    if embedded or stale_ids:
+        _mark_store_updated(persistent_directory)
+
+    # Display information about the split documents
+    logger.info("\n--- Document Chunks Information ---")
+    logger.info(
+        f"Number of document chunks: {len(wanted_ids)} "
+        f"({embedded} embedded, {len(stale_ids)} deleted, "
+        f"{len(wanted_ids & existing_ids)} unchanged)"
+    )
+    logger.info(f"\n--- Vector store at {persistent_directory} is up to date ---")
+    logger.info(f"Embedding cache: {embeddings.stats()}")
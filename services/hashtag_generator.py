@@ -1,27 +1,32 @@
-import os
-
-from dotenv import load_dotenv
-from openai import OpenAI
-
 from logging_config import get_logger
+from services.completion_cache import (acached_chat_completion,
+                                      cached_chat_completion)
 
 logger = get_logger(__name__)
-load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+def _hashtag_request(text):
+    prompt = f"Generate 10 trending Instagram hashtags for the text provided. Return them space-separated without commas or numbering. Eg. #hashtag1 #hashtag2 ... #hashtag10:\n\n{text}"
+    return {
+        "model": "gpt-4o",
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.7,
+    }
 
 
 def generate_hashtags(text):
     """
     Generate 10 trending Instagram hashtags based on the text provided.
+
+    Hashtags for text seen before come from the completion cache.
     """
-    prompt = f"Generate 10 trending Instagram hashtags for the text provided. Return them space-separated without commas or numbering. Eg. #hashtag1 #hashtag2 ... #hashtag10:\n\n{text}"
+    hashtags = cached_chat_completion(**_hashtag_request(text)).split()
+    return hashtags
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.7,
-    )
 
-    hashtags = response.choices[0].message.content.split()
+async def agenerate_hashtags(text):
+    """
+    Async version of generate_hashtags that does not block the event loop.
+    """
+    hashtags = (await acached_chat_completion(**_hashtag_request(text))).split()
     return hashtags
@@ -1,21 +1,168 @@
+import asyncio
+import base64
+import hashlib
+import json
 import os
+import shutil
+import time
+import uuid
+import weakref
+from typing import Dict, List, Optional
 
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from openai import OpenAI
+from config import (IMAGE_CACHE_MAX_ENTRIES, IMAGE_CONCURRENCY, IMAGE_COUNT,
+                    IMAGE_MODEL, IMAGE_SIZE, IMAGE_TIMEOUT,
+                    image_cache_directory)
+from logging_config import get_logger
+from services.openai_client import get_async_openai_client, get_openai_client
 
-load_dotenv()
-model = ChatOpenAI(model="gpt-4o")
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = get_logger(__name__)
 
+# asyncio primitives belong to one event loop, so each loop gets its own
+_semaphores = weakref.WeakKeyDictionary()
+_inflight: Dict[tuple, asyncio.Future] = {}
+
+
+def _image_request(summarized_news: str) -> Dict:
+    return {
+        "model": IMAGE_MODEL,
+        "prompt": f"Generate an image that summarises the article into image: ARTICLE \n\n {summarized_news}.",
+        "n": IMAGE_COUNT,
+        "size": IMAGE_SIZE,
+        "response_format": "b64_json",
+    }
+
+
+def _image_key(request: Dict) -> str:
+    payload = json.dumps(request, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cached_paths(key: str) -> Optional[List[str]]:
+    """Return the stored images for ``key`` and mark the entry as used."""
+    directory = os.path.join(image_cache_directory, key)
+    try:
+        names = sorted(os.listdir(directory))
+        # The directory's mtime orders entries for eviction
+        os.utime(directory)
+    except (FileNotFoundError, NotADirectoryError):
+        # Never stored, or evicted since
+        return None
+    return [os.path.join(directory, name) for name in names]
+
+
+def _evict_images(max_entries: int = IMAGE_CACHE_MAX_ENTRIES):
+    """Drop temporary directories left by a crash, then the least recently used
+    entries down to 90% of ``max_entries``.
+    """
+    now = time.time()
+    entries = []
+    for entry in os.scandir(image_cache_directory):
+        try:
+            mtime = entry.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        if entry.name.endswith(".tmp"):
+            # Writes finish well within IMAGE_TIMEOUT, so older ones crashed
+            if now - mtime > IMAGE_TIMEOUT:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        elif entry.is_dir():
+            entries.append((mtime, entry.path))
+
+    if len(entries) <= max_entries:
+        return
+    excess = len(entries) - int(max_entries * 0.9)
+    for _, path in sorted(entries)[:excess]:
+        shutil.rmtree(path, ignore_errors=True)
+    logger.info(f"Evicted {excess} entries from the image cache")
 
-def generate_image_from_summary(summarized_news: str):
-    response = client.images.generate(
-        prompt=f"Generate an image that summarises the article into image: ARTICLE \n\n {summarized_news}.",
-        n=3,
-        size="512x512",
-    )
 
-    image_urls = [item.url for item in response.data]
+def _store_images(key: str, response) -> List[str]:
+    """Write the decoded images to a temporary directory and move it into place."""
+    directory = os.path.join(image_cache_directory, key)
+    tmp_directory = f"{directory}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_directory)
+    try:
+        for index, item in enumerate(response.data):
+            with open(os.path.join(tmp_directory, f"{index}.png"), "wb") as image_file:
+                image_file.write(base64.b64decode(item.b64_json))
+    except BaseException:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+    try:
+        os.replace(tmp_directory, directory)
+    except OSError:
+        # Another request stored the same images first
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+    _evict_images()
+    return _cached_paths(key)
 
-    return image_urls
+
+def generate_image_from_summary(summarized_news: str) -> List[str]:
+    """Generate images for a news summary and return their local file paths.
+
+    Images are requested as base64, so nothing has to be downloaded
+    afterwards, and stored under a directory named by the hash of the
+    request. A summary seen before returns the stored files without an API
+    call.
+    """
+    request = _image_request(summarized_news)
+    key = _image_key(request)
+    paths = _cached_paths(key)
+    if paths:
+        return paths
+
+    response = get_openai_client(IMAGE_TIMEOUT).images.generate(**request)
+    return _store_images(key, response)
+
+
+async def agenerate_image_from_summary(summarized_news: str) -> List[str]:
+    """Async version of generate_image_from_summary.
+
+    At most IMAGE_CONCURRENCY generations run at once, and concurrent
+    requests for the same summary share one generation. If the request
+    generating the images is cancelled, a waiting request takes over.
+    """
+    request = _image_request(summarized_news)
+    key = _image_key(request)
+    loop = asyncio.get_running_loop()
+    inflight_key = (id(loop), key)
+    while True:
+        paths = _cached_paths(key)
+        if paths:
+            return paths
+        if inflight_key not in _inflight:
+            break
+        paths = await asyncio.shield(_inflight[inflight_key])
+        # None means the generating request was cancelled
+        if paths is not None:
+            return paths
+    future = _inflight[inflight_key] = loop.create_future()
+
+    try:
+        semaphore = _semaphores.get(loop)
+        if semaphore is None:
+            semaphore = _semaphores[loop] = asyncio.Semaphore(IMAGE_CONCURRENCY)
+        client = get_async_openai_client(IMAGE_TIMEOUT)
+        async with semaphore:
+            response = await client.images.generate(**request)
+        paths = await asyncio.to_thread(_store_images, key, response)
+    except asyncio.CancelledError:
+        # Wake the waiters to retry rather than cancelling them too
+        future.set_result(None)
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Only waiting requests see the error; mark it retrieved otherwise
+        future.exception()
+        raise
+    finally:
+        del _inflight[inflight_key]
+    future.set_result(paths)
+    return paths
+
+
+async def agenerate_images(summaries: List[str]) -> List[List[str]]:
+    """Generate images for several summaries at once, in the given order."""
+    return await asyncio.gather(
+        *[agenerate_image_from_summary(summary) for summary in summaries]
+    )
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import LEXICAL_MIN_COVERAGE
+from logging_config import get_logger
+from services.email_metadata import (MetadataFilter, MetadataIndex,
+                                     email_metadata)
+from services.email_store import iter_emails
+
+logger = get_logger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+SNIPPET_LENGTH = 1000
+# Bump when the stored metadata changes so existing entries are rebuilt
+METADATA_VERSION = 3
+# Words that carry no meaning in a mailbox search and would otherwise match
+# nearly every email
+STOPWORDS = frozenset(
+    (
+        "a about after all an and any are as at be been before by can did do "
+        "does email emails for from get got had has have how i in is it me mail "
+        "mails my of on or our please re sent show that the their them there "
+        "these this to us was we were what when where which who why will with "
+        "you your"
+    ).split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens, so order numbers and PNRs stay whole."""
+    return _TOKEN.findall(text.lower())
+
+
+def query_terms(query: str) -> Set[str]:
+    """Return the distinct query tokens that are not stopwords."""
+    return {term for term in tokenize(query) if term not in STOPWORDS}
+
+
+def _email_text(email: Dict) -> str:
+    return f"{email['subject']}\n{email['from']}\n{email['body']}"
+
+
+def _email_hash(email: Dict) -> str:
+    content = f"{METADATA_VERSION}\n{_email_text(email)}\n" + ",".join(email["labels"])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class LexicalIndex:
+    """In-memory inverted index over emails with BM25 scoring.
+
+    ``docs`` holds per-email metadata, a snippet, the indexed length, its
+    distinct terms and a content hash; ``postings`` maps each term to the
+    term frequency per email id. ``filters`` is the metadata prefilter
+    index used to restrict a search to matching emails.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Dict] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+        self.filters = MetadataIndex()
+
+    def add(self, email: Dict):
+        self.remove(email["id"])
+        counts = Counter(tokenize(_email_text(email)))
+        length = sum(counts.values())
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[email["id"]] = count
+        self.docs[email["id"]] = {
+            "hash": _email_hash(email),
+            "length": length,
+            "terms": list(counts),
+            "snippet": email["body"][:SNIPPET_LENGTH],
+            "metadata": email_metadata(email),
+        }
+        self.filters.add(email["id"], self.docs[email["id"]]["metadata"])
+        self.total_length += length
+
+    def remove(self, doc_id: str):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in doc["terms"]:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= doc["length"]
+        self.filters.remove(doc_id)
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        where: Optional[MetadataFilter] = None,
+        min_coverage: float = LEXICAL_MIN_COVERAGE,
+    ) -> List[Tuple[str, float]]:
+        """Return up to ``k`` (email id, BM25 score) pairs, best first.
+
+        Stopwords are dropped from the query, and an email must contain at
+        least ``min_coverage`` of the remaining terms to be returned, so a
+        single common word shared with the query is not a match. With
+        ``where`` only emails whose metadata match are scored; document
+        frequencies still come from the whole corpus.
+        """
+        n_docs = len(self.docs)
+        terms = query_terms(query)
+        if not n_docs or not terms:
+            return []
+        allowed = None
+        if where:
+            allowed = self.filters.candidates(where)
+            if not allowed:
+                return []
+        avg_length = self.total_length / n_docs
+        scores: Dict[str, float] = {}
+        matched: Counter = Counter()
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in postings.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                length = self.docs[doc_id]["length"]
+                norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                tf_weight = tf * (self.k1 + 1) / (tf + norm)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf_weight
+                matched[doc_id] += 1
+        required = max(1, math.ceil(min_coverage * len(terms)))
+        hits = [item for item in scores.items() if matched[item[0]] >= required]
+        return sorted(hits, key=lambda item: item[1], reverse=True)[:k]
+
+    def update_from_emails(self, emails_path: str) -> Tuple[int, int]:
+        """Index new or changed emails and drop missing ones.
+
+        Returns the number of (re)indexed and removed emails.
+        """
+        seen = set()
+        indexed = 0
+        for email in iter_emails(emails_path):
+            seen.add(email["id"])
+            doc = self.docs.get(email["id"])
+            if doc is None or doc["hash"] != _email_hash(email):
+                self.add(email)
+                indexed += 1
+        removed = [doc_id for doc_id in self.docs if doc_id not in seen]
+        for doc_id in removed:
+            self.remove(doc_id)
+        return indexed, len(removed)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as index_file:
+            json.dump(
+                {"docs": self.docs, "postings": self.postings},
+                index_file,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        index = cls()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as index_file:
+                data = json.load(index_file)
+            index.docs = data["docs"]
+            index.postings = data["postings"]
+            index.total_length = sum(doc["length"] for doc in index.docs.values())
+            for doc_id, doc in index.docs.items():
+                index.filters.add(doc_id, doc["metadata"])
+        return index
+
+
+def update_lexical_index(emails_path: str, index_path: str):
+    """Bring the on-disk lexical index in line with the emails file."""
+    index = LexicalIndex.load(index_path)
+    indexed, removed = index.update_from_emails(emails_path)
+    index.save(index_path)
+    logger.info(
+        f"Lexical index: {indexed} emails indexed, {removed} removed, "
+        f"{len(index.docs)} total"
+    )
+
+
+_index: Optional[LexicalIndex] = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index(index_path: str) -> LexicalIndex:
+    """Return the loaded index, reloading it when the file has been rewritten."""
+    global _index, _index_mtime
+    mtime = os.path.getmtime(index_path) if os.path.exists(index_path) else None
+    with _index_lock:
+        if _index is None or mtime != _index_mtime:
+            _index = LexicalIndex.load(index_path)
+            _index_mtime = mtime
+        return _index
@@ -0,0 +1,193 @@
+import queue
+import random
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
+
+from config import (NEWS_CACHE_SIZE, NEWS_CACHE_TTL, NEWS_MAX_RESULTS,
+                    NEWS_PREFETCH_INTERVAL, NEWS_PREFETCH_REGIONS,
+                    NEWS_PREFETCH_WORKERS)
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+NEWS_TOPICS = [
+    "WORLD",
+    "SCIENCE",
+    "ECONOMY",
+    "ENERGY",
+    "VIRTUAL REALITY",
+    "ROBOTICS",
+    "NUTRITION",
+    "MENTAL HEALTH",
+    "WILDLIFE",
+    "ENVIRONMENT",
+    "NEUROSCIENCE",
+    "JOBS",
+    "FOOD",
+    "TRAVEL",
+]
+
+# ("keyword" | "topic", query, language, country)
+CacheKey = Tuple[str, str, str, str]
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+_cache = TTLCache(maxsize=NEWS_CACHE_SIZE, ttl=NEWS_CACHE_TTL)
+_inflight: Dict[CacheKey, Future] = {}
+_cache_lock = threading.Lock()
+
+_prefetch_thread = None
+_prefetch_stop = threading.Event()
+_prefetch_lock = threading.Lock()
+
+
+def _get_client(language: str, country: str):
+    """Return the GNews client for a language and country, creating it once."""
+    with _clients_lock:
+        client = _clients.get((language, country))
+        if client is None:
+            from gnews import GNews
+
+            client = GNews(
+                language=language, country=country, max_results=NEWS_MAX_RESULTS
+            )
+            _clients[(language, country)] = client
+    return client
+
+
+def _fetch(key: CacheKey) -> List[Dict]:
+    kind, query, language, country = key
+    client = _get_client(language, country)
+    if kind == "keyword":
+        return client.get_news(query)
+    return client.get_news_by_topic(query)
+
+
+def get_articles(key: CacheKey, refresh: bool = False) -> List[Dict]:
+    """Return the articles for a keyword or topic, from the cache when fresh.
+
+    Concurrent requests for the same key share one fetch. ``refresh`` skips
+    the cached copy and replaces it.
+    """
+    with _cache_lock:
+        if not refresh and key in _cache:
+            return _cache[key]
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+
+    if not owner:
+        return future.result()
+
+    try:
+        articles = _fetch(key)
+    except Exception as e:
+        with _cache_lock:
+            del _inflight[key]
+        future.set_exception(e)
+        raise
+    with _cache_lock:
+        # Empty results are not cached so the next call tries again
+        if articles:
+            _cache[key] = articles
+        del _inflight[key]
+    future.set_result(articles)
+    return articles
+
+
+def topic_key(topic: str, language: str, country: str) -> CacheKey:
+    return ("topic", topic.upper(), language, country)
+
+
+def keyword_key(keyword: str, language: str, country: str) -> CacheKey:
+    return ("keyword", " ".join(keyword.lower().split()), language, country)
+
+
+def random_topic(language: str, country: str) -> str:
+    """Pick a random topic, preferring ones already in the cache."""
+    with _cache_lock:
+        cached = [
+            topic
+            for topic in NEWS_TOPICS
+            if topic_key(topic, language, country) in _cache
+        ]
+    return random.choice(cached or NEWS_TOPICS)
+
+
+def _prefetch_topics():
+    pending = queue.SimpleQueue()
+    for language, country in NEWS_PREFETCH_REGIONS:
+        for topic in NEWS_TOPICS:
+            pending.put(topic_key(topic, language, country))
+    total = pending.qsize()
+    failed = []
+
+    def worker():
+        while True:
+            try:
+                key = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                get_articles(key, refresh=True)
+            except Exception as e:
+                failed.append(key)
+                logger.warning(f"Prefetching news for {key[1]} failed: {e}")
+
+    # Daemon threads, so a slow fetch never holds up interpreter exit
+    workers = [
+        threading.Thread(target=worker, name="news-prefetch", daemon=True)
+        for _ in range(NEWS_PREFETCH_WORKERS)
+    ]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    logger.info(f"Prefetched {total - len(failed)} of {total} news topics")
+
+
+def _prefetch_loop():
+    while not _prefetch_stop.is_set():
+        _prefetch_topics()
+        _prefetch_stop.wait(NEWS_PREFETCH_INTERVAL)
+
+
+def start_news_prefetch():
+    """Keep the fixed topics warm in the cache from a background thread.
+
+    Topics for every region in NEWS_PREFETCH_REGIONS are fetched right away
+    and refreshed every NEWS_PREFETCH_INTERVAL seconds, before their cache
+    entries expire. Calling it again while it runs does nothing.
+    """
+    global _prefetch_thread
+    with _prefetch_lock:
+        if _prefetch_thread is not None and _prefetch_thread.is_alive():
+            return
+        _prefetch_stop.clear()
+        _prefetch_thread = threading.Thread(
+            target=_prefetch_loop, name="news-prefetch", daemon=True
+        )
+        _prefetch_thread.start()
+
+
+def stop_news_prefetch():
+    """Stop refreshing after the current round of prefetching."""
+    _prefetch_stop.set()
+
+
+def find_article(
+    keyword: Optional[str], language: str, country: str
+) -> Tuple[str, Optional[Dict]]:
+    """Return ``(topic, article)`` for a keyword or a random topic."""
+    if keyword:
+        topic = keyword.upper()
+        articles = get_articles(keyword_key(keyword, language, country))
+    else:
+        topic = random_topic(language, country)
+        articles = get_articles(topic_key(topic, language, country))
+    return topic, articles[0] if articles else None
@@ -0,0 +1,115 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from config import (OPENAI_CONNECT_TIMEOUT, OPENAI_KEEPALIVE_EXPIRY,
+                    OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE,
+                    OPENAI_MAX_RETRIES, OPENAI_TIMEOUT)
+
+load_dotenv()
+
+_http_client = None
+_async_http_client = None
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def _http_settings() -> Dict[str, Any]:
+    import httpx
+
+    return {
+        "limits": httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    }
+
+
+def get_http_client():
+    """Return the process-wide sync HTTP connection pool for OpenAI calls.
+
+    Every OpenAI client and LangChain model shares it, so concurrent tool
+    calls reuse warm keep-alive TLS connections instead of opening new ones.
+    """
+    global _http_client
+    with _client_lock:
+        if _http_client is None:
+            import httpx
+
+            _http_client = httpx.Client(**_http_settings())
+    return _http_client
+
+
+def get_async_http_client():
+    """Return the process-wide async HTTP connection pool for OpenAI calls.
+
+    Its connections belong to the event loop that opened them, so it is
+    meant for the one loop running the chat REPL or the server.
+    """
+    global _async_http_client
+    with _client_lock:
+        if _async_http_client is None:
+            import httpx
+
+            _async_http_client = httpx.AsyncClient(**_http_settings())
+    return _async_http_client
+
+
+def langchain_client_kwargs() -> Dict[str, Any]:
+    """Return the arguments that put a LangChain OpenAI model on the shared pools."""
+    return {
+        "http_client": get_http_client(),
+        "http_async_client": get_async_http_client(),
+        "max_retries": OPENAI_MAX_RETRIES,
+        "request_timeout": OPENAI_TIMEOUT,
+    }
+
+
+def get_openai_client(timeout: Optional[float] = None):
+    """Return the process-wide OpenAI client, creating it on first use.
+
+    The ``openai`` package is imported here rather than at module level so
+    importing a service does not pay for it until a request is made. Failed
+    calls are retried up to OPENAI_MAX_RETRIES times with jittered
+    exponential backoff, honouring Retry-After. ``timeout`` sets a per-call
+    deadline in seconds on the same connection pool.
+    """
+    global _client
+    http_client = get_http_client()
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+
+            _client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=http_client,
+                max_retries=OPENAI_MAX_RETRIES,
+                timeout=OPENAI_TIMEOUT,
+            )
+    if timeout is not None:
+        return _client.with_options(timeout=timeout)
+    return _client
+
+
+def get_async_openai_client(timeout: Optional[float] = None):
+    """Return the process-wide AsyncOpenAI client, creating it on first use."""
+    global _async_client
+    http_client = get_async_http_client()
+    with _client_lock:
+        if _async_client is None:
+            from openai import AsyncOpenAI
+
+            _async_client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=http_client,
+                max_retries=OPENAI_MAX_RETRIES,
+                timeout=OPENAI_TIMEOUT,
+            )
+    if timeout is not None:
+        return _async_client.with_options(timeout=timeout)
+    return _async_client
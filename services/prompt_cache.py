@@ -0,0 +1,39 @@
+import os
+import warnings
+
+from config import prompt_cache_directory
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def _cache_path(name: str) -> str:
+    return os.path.join(prompt_cache_directory, name.replace("/", "__") + ".json")
+
+
+def pull_prompt(name: str):
+    """Return a LangChain Hub prompt, pulling it only when it is not cached.
+
+    The pulled prompt is serialized next to the other caches, so later
+    starts load it from disk without a network round trip. Delete the file
+    to pick up a newer version of the prompt.
+    """
+    from langchain_core.load import dumps, loads
+
+    path = _cache_path(name)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as prompt_file, warnings.catch_warnings():
+            # loads() is marked beta; the cache only holds what dumps() wrote
+            warnings.simplefilter("ignore")
+            return loads(prompt_file.read())
+
+    from langchain import hub
+
+    logger.info(f"Pulling prompt {name} from LangChain Hub")
+    prompt = hub.pull(name)
+    os.makedirs(prompt_cache_directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as prompt_file:
+        prompt_file.write(dumps(prompt))
+    os.replace(tmp_path, path)
+    return prompt
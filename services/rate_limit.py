@@ -0,0 +1,51 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Token-bucket limiter for requests-per-minute and tokens-per-minute budgets.
+
+    ``acquire`` blocks until one request and ``tokens`` tokens fit in both
+    budgets. It is safe to call from several threads.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed_minutes = (now - self._updated) / 60
+        self._updated = now
+        self._requests = min(
+            self.requests_per_minute,
+            self._requests + elapsed_minutes * self.requests_per_minute,
+        )
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + elapsed_minutes * self.tokens_per_minute,
+            )
+
+    def acquire(self, tokens: int = 0):
+        if self.tokens_per_minute:
+            # A single oversized request may use the whole budget but no more
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                request_wait = (1 - self._requests) / self.requests_per_minute * 60
+                token_wait = 0.0
+                if self.tokens_per_minute:
+                    token_wait = (tokens - self._tokens) / self.tokens_per_minute * 60
+                wait = max(request_wait, token_wait)
+                if wait <= 0:
+                    self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+            time.sleep(wait)
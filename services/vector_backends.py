@@ -0,0 +1,527 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import MMAP_VECTOR_DTYPE, VECTOR_BACKEND
+from logging_config import get_logger
+from services.email_metadata import (LABEL_PREFIX, MetadataFilter,
+                                     metadata_labels)
+
+logger = get_logger(__name__)
+
+# (content, metadata, relevance score)
+Hit = Tuple[str, Dict, float]
+
+# Metadata fields the mmap backend copies into indexed SQLite columns
+FILTER_COLUMNS = ("epoch", "sender", "sender_domain", "sender_site", "sender_org")
+
+
+def store_version_path(directory: str) -> str:
+    """Return the marker file touched whenever the vector store changes."""
+    return os.path.join(directory, "store_version")
+
+
+def _relevance_from_squared_l2(distance: float) -> float:
+    # langchain_chroma turns Chroma's squared L2 distance into a relevance
+    # score with 1 - d / sqrt(2); every backend reports scores on that scale
+    # so SCORE_THRESHOLD means the same thing everywhere
+    return 1.0 - distance / math.sqrt(2)
+
+
+class ChromaBackend:
+    """Vector backend storing chunks in a persistent Chroma collection."""
+
+    # langchain_chroma's default collection, which existing stores use
+    COLLECTION_NAME = "langchain"
+
+    def __init__(self, directory: str, embeddings):
+        # Imported here so only processes that open a Chroma store pay for it
+        import chromadb
+        from langchain_chroma import Chroma
+
+        self.embeddings = embeddings
+        client = chromadb.PersistentClient(path=directory)
+        self.db = Chroma(
+            client=client,
+            collection_name=self.COLLECTION_NAME,
+            embedding_function=embeddings,
+        )
+        # Writes use chromadb's collection directly, since the LangChain
+        # wrapper can only add texts it embeds itself
+        self.collection = client.get_collection(self.COLLECTION_NAME)
+
+    def existing_ids(self) -> Set[str]:
+        return set(self.db.get(include=[])["ids"])
+
+    def upsert(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict],
+        vectors: List[List[float]],
+    ):
+        self.collection.upsert(
+            ids=ids, embeddings=vectors, documents=documents, metadatas=metadatas
+        )
+
+    def delete(self, ids: List[str]):
+        self.db.delete(ids=ids)
+
+    def search_vector(
+        self,
+        vector: List[float],
+        k: int,
+        score_threshold: float,
+        where: Optional[MetadataFilter] = None,
+    ) -> List[Hit]:
+        # Chroma resolves the where clause on its metadata index first and only
+        # ranks the matching chunks
+        results = self.db.similarity_search_by_vector_with_relevance_scores(
+            vector, k=k, filter=where.to_chroma_where() if where else None
+        )
+        # Despite its name the call above returns raw squared L2 distances,
+        # the default space of the collection
+        hits = []
+        for doc, distance in results:
+            score = _relevance_from_squared_l2(distance)
+            if score >= score_threshold:
+                hits.append((doc.page_content, doc.metadata, score))
+        return hits
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        score_threshold: float,
+        where: Optional[MetadataFilter] = None,
+    ) -> List[Hit]:
+        return self.search_vector(
+            self.embeddings.embed_query(query), k, score_threshold, where
+        )
+
+
+class MmapBackend:
+    """Vector backend keeping normalized embeddings in a memory-mapped matrix.
+
+    Vectors are stored as float16, or as int8 with a per-row float32 scale,
+    in an append-only file; chunk ids, texts and metadata live in a SQLite
+    side table keyed by row number. Updates append a new row and tombstone
+    the old one, and the matrix is compacted once a quarter of it is dead.
+    Search is a blocked NumPy dot product over the map plus ``argpartition``.
+
+    The filterable metadata fields and labels are also kept in indexed
+    columns, so a filtered search looks up the matching rows in SQLite and
+    only reads and scores those rows of the matrix.
+
+    Compaction writes the surviving rows to new files of the next
+    generation and renumbers the rows in the same transaction that records
+    that generation, so a map that another thread or process still reads is
+    never truncated. Searches remap when another process has committed to
+    the store, and redo the search if the rows were renumbered before their
+    documents were read.
+    """
+
+    BLOCK_ROWS = 1024
+    COMPACT_RATIO = 0.25
+    SEARCH_ATTEMPTS = 3
+
+    def __init__(self, directory: str, embeddings, dtype: str = MMAP_VECTOR_DTYPE):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported mmap vector dtype: {dtype}")
+        self.embeddings = embeddings
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.RLock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(directory, "metadata.sqlite"), check_same_thread=False
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, "
+            "id TEXT NOT NULL, document TEXT NOT NULL, metadata TEXT NOT NULL, "
+            "deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        for column in FILTER_COLUMNS:
+            if column not in columns:
+                # Rows written before filtering existed stay NULL and never
+                # match a filter until they are re-ingested
+                self._conn.execute(f"ALTER TABLE chunks ADD COLUMN {column}")
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS chunks_{column} ON chunks ({column})"
+            )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_id ON chunks (id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_labels "
+            "(row INTEGER NOT NULL, label TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS chunk_labels_label ON chunk_labels (label, row)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.commit()
+        self._open()
+
+    def _paths(self, generation: int) -> Tuple[str, str]:
+        """Return the matrix and scales files of a compaction generation."""
+        # Generation 0 keeps the names used before compaction wrote new files
+        suffix = f".{generation}" if generation else ""
+        return (
+            os.path.join(self.directory, f"vectors{suffix}.{self.dtype.name}"),
+            os.path.join(self.directory, f"scales{suffix}.float32"),
+        )
+
+    def _stored_generation(self) -> int:
+        generation = self._conn.execute(
+            "SELECT value FROM settings WHERE key = 'generation'"
+        ).fetchone()
+        return int(generation[0]) if generation else 0
+
+    def _open(self):
+        """(Re)map the matrix and load the tombstone mask from the side table.
+
+        Everything is read in one transaction, so the row count, dimension,
+        generation and tombstones describe the same state of the store.
+        """
+        self._conn.execute("BEGIN")
+        try:
+            self.n_rows = self._conn.execute(
+                "SELECT COALESCE(MAX(row) + 1, 0) FROM chunks"
+            ).fetchone()[0]
+            dim = self._conn.execute(
+                "SELECT value FROM settings WHERE key = 'dim'"
+            ).fetchone()
+            self.dim = int(dim[0]) if dim else None
+            self.generation = self._stored_generation()
+            deleted = [
+                row
+                for (row,) in self._conn.execute(
+                    "SELECT row FROM chunks WHERE deleted = 1"
+                )
+            ]
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        finally:
+            self._conn.commit()
+        alive = np.ones(self.n_rows, dtype=bool)
+        alive[deleted] = False
+        self.matrix_path, self.scales_path = self._paths(self.generation)
+
+        if self.n_rows and self.dim:
+            matrix = np.memmap(
+                self.matrix_path,
+                dtype=self.dtype,
+                mode="r",
+                shape=(self.n_rows, self.dim),
+            )
+            scales = (
+                np.memmap(
+                    self.scales_path, dtype=np.float32, mode="r", shape=(self.n_rows,)
+                )
+                if self.dtype == np.int8
+                else None
+            )
+        else:
+            matrix = scales = None
+        # Searches copy these references under the lock and then read the
+        # map without it, so they are replaced together, never modified
+        self.matrix, self.scales, self.alive = matrix, scales, alive
+
+    def _refresh(self):
+        """Remap when another process has committed changes to the store."""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._open()
+
+    def _quantize(self, vectors: np.ndarray):
+        if self.dtype == np.float16:
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    @staticmethod
+    def _write_rows(path: str, offset: int, data: np.ndarray):
+        """Write rows at ``offset``, dropping bytes left by an interrupted write.
+
+        Only ever called at the end of the mapped rows, so the file never
+        shrinks under a live map.
+        """
+        mode = "r+b" if os.path.exists(path) else "wb"
+        with open(path, mode) as matrix_file:
+            matrix_file.seek(offset)
+            matrix_file.write(data.tobytes())
+            matrix_file.truncate()
+
+    @staticmethod
+    def _write_file(path: str, data: np.ndarray):
+        """Write a whole new file under a temporary name, then move it in place."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as matrix_file:
+            matrix_file.write(data.tobytes())
+        os.replace(tmp_path, path)
+
+    def existing_ids(self) -> Set[str]:
+        with self._lock:
+            return {
+                chunk_id
+                for (chunk_id,) in self._conn.execute(
+                    "SELECT id FROM chunks WHERE deleted = 0"
+                )
+            }
+
+    def upsert(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict],
+        vectors: List[List[float]],
+    ):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        quantized, scales = self._quantize(vectors)
+
+        with self._lock:
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._conn.execute(
+                    "INSERT INTO settings (key, value) VALUES ('dim', ?)",
+                    (str(self.dim),),
+                )
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match "
+                    f"the index dimension {self.dim}"
+                )
+
+            # Vectors go to disk before the rows that reference them, so an
+            # interrupted write leaves only unreferenced bytes behind
+            start = self.n_rows
+            self._write_rows(
+                self.matrix_path, start * self.dim * self.dtype.itemsize, quantized
+            )
+            if scales is not None:
+                self._write_rows(self.scales_path, start * 4, scales)
+
+            self._tombstone(ids)
+            self._conn.executemany(
+                f"INSERT INTO chunks (row, id, document, metadata, "
+                f"{', '.join(FILTER_COLUMNS)}) "
+                f"VALUES (?, ?, ?, ?{', ?' * len(FILTER_COLUMNS)})",
+                [
+                    (start + offset, chunk_id, document, json.dumps(metadata))
+                    + tuple(metadata.get(column) for column in FILTER_COLUMNS)
+                    for offset, (chunk_id, document, metadata) in enumerate(
+                        zip(ids, documents, metadatas)
+                    )
+                ],
+            )
+            self._conn.executemany(
+                "INSERT INTO chunk_labels (row, label) VALUES (?, ?)",
+                [
+                    (start + offset, label)
+                    for offset, metadata in enumerate(metadatas)
+                    for label in metadata_labels(metadata)
+                ],
+            )
+            self._conn.commit()
+            self._open()
+            self._maybe_compact()
+
+    def _tombstone(self, ids: Iterable[str]):
+        self._conn.executemany(
+            "UPDATE chunks SET deleted = 1 WHERE id = ? AND deleted = 0",
+            [(chunk_id,) for chunk_id in ids],
+        )
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self._refresh()
+            self._tombstone(ids)
+            self._conn.commit()
+            self._open()
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        dead = self.n_rows - int(self.alive.sum())
+        if not dead or dead < self.n_rows * self.COMPACT_RATIO:
+            return
+
+        keep = np.flatnonzero(self.alive)
+        old_paths = (self.matrix_path, self.scales_path)
+        generation = self.generation + 1
+        matrix_path, scales_path = self._paths(generation)
+        self._write_file(matrix_path, np.ascontiguousarray(self.matrix[keep]))
+        if self.scales is not None:
+            self._write_file(scales_path, np.ascontiguousarray(self.scales[keep]))
+
+        self._conn.execute(
+            "DELETE FROM chunk_labels WHERE row IN "
+            "(SELECT row FROM chunks WHERE deleted = 1)"
+        )
+        self._conn.execute("DELETE FROM chunks WHERE deleted = 1")
+        moves = [(new, int(old)) for new, old in enumerate(keep)]
+        self._conn.executemany("UPDATE chunks SET row = ? WHERE row = ?", moves)
+        self._conn.executemany("UPDATE chunk_labels SET row = ? WHERE row = ?", moves)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES ('generation', ?)",
+            (str(generation),),
+        )
+        self._conn.commit()
+        self._open()
+        # Maps of the old files stay readable after they are unlinked
+        for path in old_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        logger.info(f"Compacted mmap vector index, dropped {dead} rows")
+
+    def _filtered_rows(self, where: MetadataFilter) -> np.ndarray:
+        """Return the live rows matching the filter, in ascending order."""
+        clauses, params = ["deleted = 0"], []
+        for field, operator, value in where.conditions():
+            if field.startswith(LABEL_PREFIX):
+                clauses.append("row IN (SELECT row FROM chunk_labels WHERE label = ?)")
+                params.append(field[len(LABEL_PREFIX) :])
+            else:
+                clauses.append(f"{field} {'=' if operator == '==' else operator} ?")
+                params.append(value)
+        rows = self._conn.execute(
+            f"SELECT row FROM chunks WHERE {' AND '.join(clauses)} ORDER BY row",
+            params,
+        ).fetchall()
+        return np.array([row for (row,) in rows], dtype=np.int64)
+
+    def _documents(
+        self, rows: List[int], generation: int
+    ) -> Optional[Dict[int, Tuple[str, str]]]:
+        """Return (document, metadata JSON) per row of the given generation.
+
+        Returns None when the rows have been renumbered by a compaction
+        since, as their numbers then point at other chunks.
+        """
+        placeholders = ", ".join("?" * len(rows))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if self._stored_generation() != generation:
+                    return None
+                return {
+                    row: (document, metadata)
+                    for row, document, metadata in self._conn.execute(
+                        "SELECT row, document, metadata FROM chunks "
+                        f"WHERE row IN ({placeholders})",
+                        rows,
+                    )
+                }
+            finally:
+                self._conn.commit()
+
+    def search_vector(
+        self,
+        vector: List[float],
+        k: int,
+        score_threshold: float,
+        where: Optional[MetadataFilter] = None,
+    ) -> List[Hit]:
+        query = np.array(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+
+        for _ in range(self.SEARCH_ATTEMPTS):
+            hits = self._search_once(query, k, score_threshold, where)
+            if hits is not None:
+                return hits
+            logger.info("Mmap vector index was compacted during a search, retrying")
+        return []
+
+    def _search_once(
+        self,
+        query: np.ndarray,
+        k: int,
+        score_threshold: float,
+        where: Optional[MetadataFilter],
+    ) -> Optional[List[Hit]]:
+        with self._lock:
+            self._refresh()
+            matrix, scales, alive = self.matrix, self.scales, self.alive
+            generation = self.generation
+            rows = self._filtered_rows(where) if where else None
+        if matrix is None:
+            return []
+
+        if rows is None:
+            cosine = np.empty(len(matrix), dtype=np.float32)
+            for start in range(0, len(matrix), self.BLOCK_ROWS):
+                block = matrix[start : start + self.BLOCK_ROWS].astype(np.float32)
+                cosine[start : start + len(block)] = block @ query
+            if scales is not None:
+                cosine *= scales
+            cosine[~alive] = -np.inf
+            rows = np.arange(len(matrix))
+        else:
+            # Only the pages holding the matching rows are read from the map
+            rows = rows[rows < len(matrix)]
+            cosine = np.empty(len(rows), dtype=np.float32)
+            for start in range(0, len(rows), self.BLOCK_ROWS):
+                block_rows = rows[start : start + self.BLOCK_ROWS]
+                block = matrix[block_rows].astype(np.float32)
+                cosine[start : start + len(block)] = block @ query
+            if scales is not None:
+                cosine *= scales[rows]
+        if not len(cosine):
+            return []
+
+        k = min(k, len(cosine))
+        top = np.argpartition(-cosine, k - 1)[:k]
+        top = top[np.argsort(-cosine[top])]
+
+        scored = []
+        for index in top:
+            if not np.isfinite(cosine[index]):
+                continue
+            # For unit vectors the squared L2 distance is 2 - 2 * cosine
+            score = _relevance_from_squared_l2(2 - 2 * float(cosine[index]))
+            if score >= score_threshold:
+                scored.append((int(rows[index]), score))
+        if not scored:
+            return []
+
+        documents = self._documents([row for row, _ in scored], generation)
+        if documents is None:
+            return None
+        hits = []
+        for row, score in scored:
+            if row in documents:
+                document, metadata = documents[row]
+                hits.append((document, json.loads(metadata), score))
+        return hits
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        score_threshold: float,
+        where: Optional[MetadataFilter] = None,
+    ) -> List[Hit]:
+        return self.search_vector(
+            self.embeddings.embed_query(query), k, score_threshold, where
+        )
+
+
+def get_vector_backend(directory: str, embeddings, backend: Optional[str] = None):
+    """Return the configured vector backend for the given directory."""
+    backend = backend or VECTOR_BACKEND
+    if backend == "mmap":
+        return MmapBackend(directory, embeddings)
+    if backend == "chroma":
+        return ChromaBackend(directory, embeddings)
+    raise ValueError(f"Unknown vector backend: {backend}")
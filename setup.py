@@ -1,12 +1,15 @@
-from config import (EMAIL_LABELS, MAX_RESULTS, json_file_path,
-                    persistent_directory)
+from config import (EMAIL_LABELS, MAX_RESULTS, jsonl_file_path,
+                    lexical_index_path, vector_store_directory)
 from services.gmail_download import fetch_emails_to_json
 from services.gmail_vector_store import initialize_vector_store
+from services.lexical_index import update_lexical_index
 
 if __name__ == "__main__":
     fetch_emails_to_json(
         labels=EMAIL_LABELS,
         max_results=MAX_RESULTS,
-        download_json_file_path=json_file_path,
+        download_json_file_path=jsonl_file_path,
+        incremental=True,
     )
-    initialize_vector_store(json_file_path, persistent_directory)
+    update_lexical_index(jsonl_file_path, lexical_index_path)
+    initialize_vector_store(jsonl_file_path, vector_store_directory)
@@ -1,6 +1,6 @@
-from tools.gmail_live_tool import search_gmail_live_tool
+from tools.gmail_live_tool import gmail_email_body_tool, search_gmail_live_tool
 from tools.gmail_rag_tool import search_gmail_rag_tool
 from tools.gmail_tool import search_gmail_combined_tool
 from tools.hashtag_generator_tool import hashtag_tool
-from tools.news_summarizer_tool import news_tool
+from tools.news_summarizer_tool import news_digest_tool, news_tool
 from tools.datetime_tool import datetime_tool
@@ -1,8 +1,9 @@
 from langchain_core.tools import StructuredTool
 from pydantic import BaseModel
 
+from config import LIVE_SEARCH_HYDRATE_TOP
 from logging_config import get_logger
-from services.gmail_search import search_gmail_service
+from services.gmail_search import get_email_body, search_gmail_metadata
 
 logger = get_logger(__name__)
 
@@ -11,10 +12,34 @@ class GmailSearchInput(BaseModel):
     query: str  # Search query for Gmail (e.g., "label:inbox")
 
 
+class GmailEmailBodyInput(BaseModel):
+    id: str  # Gmail message id returned by a search
+
+
+def search_gmail_live(query: str, max_results: int = 5):
+    """Search Gmail returning headers and snippets, with bodies for the top hits."""
+    return search_gmail_metadata(
+        query=query, max_results=max_results, hydrate_top=LIVE_SEARCH_HYDRATE_TOP
+    )
+
+
 # Define the tool
 search_gmail_live_tool = StructuredTool(
     name="search_gmail_live",
-    description="Search Gmail for relevant emails based on a query.",
-    func=search_gmail_service,
+    description=(
+        "Search Gmail for relevant emails based on a query. Returns subject, "
+        "sender, date, labels and a snippet for each email; use "
+        "get_gmail_email_body with an email's id to read its full body."
+    ),
+    func=search_gmail_live,
     args_schema=GmailSearchInput,
 )
+
+gmail_email_body_tool = StructuredTool(
+    name="get_gmail_email_body",
+    description=(
+        "Fetch the full body of an email by the id returned from a Gmail search."
+    ),
+    func=get_email_body,
+    args_schema=GmailEmailBodyInput,
+)
@@ -1,43 +1,205 @@
-from langchain.tools import StructuredTool
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from pydantic import BaseModel
+import copy
+import os
+import threading
+from typing import List, Literal, Optional, get_args
 
-from config import (EMBEDDING_MODEL, NUMBER_OF_DOCUMENTS, SCORE_THRESHOLD,
-                    persistent_directory)
+from cachetools import TTLCache
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, Field
 
-embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
-db = Chroma(persist_directory=persistent_directory, embedding_function=embeddings)
+from config import (LEXICAL_MIN_COVERAGE, NUMBER_OF_DOCUMENTS,
+                    QUERY_CACHE_SIZE, QUERY_CACHE_TTL, RETRIEVAL_MODE,
+                    SCORE_THRESHOLD, lexical_index_path, vector_store_directory)
+from services.email_metadata import MetadataFilter, display_metadata
+from services.embedding_cache import get_embeddings
+from services.lexical_index import get_lexical_index
+from services.vector_backends import get_vector_backend, store_version_path
 
-class GmailQueryInput(BaseModel):
+_store = None
+_store_lock = threading.Lock()
+
+_query_cache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+_query_cache_lock = threading.Lock()
+_query_cache_version = None
+
+# Reciprocal rank fusion constant from the original RRF paper
+RRF_K = 60
+
+RetrievalMode = Literal["vector", "lexical", "hybrid"]
+
+
+def get_vector_store():
+    """Open the vector store on first use instead of at import time."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = get_vector_backend(vector_store_directory, get_embeddings())
+    return _store
+
+
+def warm_retrieval(mode: RetrievalMode = RETRIEVAL_MODE):
+    """Open the vector store and load the lexical index that ``mode`` uses."""
+    if mode != "lexical":
+        get_vector_store()
+    if mode != "vector":
+        get_lexical_index(lexical_index_path)
+
+
+class EmailFilterInput(BaseModel):
+    """Metadata constraints shared by the Gmail search tools."""
+
+    labels: Optional[List[str]] = Field(
+        None, description="Only emails carrying all of these Gmail labels"
+    )
+    sender: Optional[str] = Field(
+        None,
+        description=(
+            "Only emails from this sender: a full address, a domain such as "
+            "amazon.in, or an organisation name such as amazon"
+        ),
+    )
+    after: Optional[str] = Field(
+        None,
+        description="Only emails on or after this date: YYYY-MM-DD, or an age "
+        "such as 7d, 2w, 1m, 1y",
+    )
+    before: Optional[str] = Field(
+        None, description="Only emails before this date: YYYY-MM-DD or an age"
+    )
+
+
+class GmailQueryInput(EmailFilterInput):
     query: str
+    mode: RetrievalMode = Field(
+        RETRIEVAL_MODE,
+        description=(
+            "'vector' for semantic questions, 'lexical' for exact order numbers, "
+            "PNRs, sender names or phrases, 'hybrid' to combine both"
+        ),
+    )
+
+
+def check_retrieval_mode(mode: str):
+    """Raise ValueError for a mode that is not a RetrievalMode."""
+    if mode not in get_args(RetrievalMode):
+        raise ValueError(
+            f"Unknown retrieval mode {mode!r}, use one of {get_args(RetrievalMode)}"
+        )
+
+
+def _vector_search(query: str, where: MetadataFilter):
+    hits = get_vector_store().search(
+        query, k=NUMBER_OF_DOCUMENTS, score_threshold=SCORE_THRESHOLD, where=where
+    )
+    return [(content, metadata) for content, metadata, _ in hits]
 
 
-def query_gmail_vector_store(query: str):
-    """Query the Gmail-based vector store and retrieve relevant documents."""
-    retriever = db.as_retriever(
-        search_type="similarity_score_threshold",
-        search_kwargs={"k": NUMBER_OF_DOCUMENTS, "score_threshold": SCORE_THRESHOLD},
+def _lexical_search(
+    query: str, where: MetadataFilter, min_coverage: float = LEXICAL_MIN_COVERAGE
+):
+    index = get_lexical_index(lexical_index_path)
+    hits = index.search(
+        query, k=NUMBER_OF_DOCUMENTS, where=where, min_coverage=min_coverage
     )
-    relevant_docs = retriever.invoke(query)
+    return [
+        (index.docs[doc_id]["snippet"], index.docs[doc_id]["metadata"])
+        for doc_id, _ in hits
+    ]
+
+
+def _fuse(*rankings):
+    """Merge ranked hit lists with reciprocal rank fusion, one hit per email."""
+    scores, hits = {}, {}
+    for ranking in rankings:
+        seen = set()
+        for rank, (content, metadata) in enumerate(ranking):
+            key = metadata.get("id", content)
+            if key in seen:
+                continue
+            seen.add(key)
+            scores[key] = scores.get(key, 0.0) + 1 / (RRF_K + rank + 1)
+            hits.setdefault(key, (content, metadata))
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [hits[key] for key in ranked[:NUMBER_OF_DOCUMENTS]]
+
+
+def _data_version():
+    """Return a marker that changes whenever the vector store or index is rebuilt."""
+    version = []
+    for path in (store_version_path(vector_store_directory), lexical_index_path):
+        version.append(os.path.getmtime(path) if os.path.exists(path) else None)
+    return tuple(version)
+
+
+def query_gmail_vector_store(
+    query: str,
+    mode: RetrievalMode = RETRIEVAL_MODE,
+    labels: Optional[List[str]] = None,
+    sender: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+):
+    """Query the Gmail-based vector store and retrieve relevant documents.
+
+    ``mode`` selects vector similarity, the local BM25 index (no network
+    call), or a reciprocal rank fusion of both. In hybrid mode lexical hits
+    need every query term when no vector hit clears SCORE_THRESHOLD, so an
+    unrelated question still finds nothing. ``labels``, ``sender``,
+    ``after`` and ``before`` restrict both searches to matching emails
+    before any ranking happens. Results are cached per normalized query for
+    QUERY_CACHE_TTL seconds and dropped as soon as the vector store or
+    lexical index is updated; every call returns its own copy.
+    """
+    global _query_cache_version
+    check_retrieval_mode(mode)
+    where = MetadataFilter.from_query(labels, sender, after, before)
+    key = (
+        " ".join(query.lower().split()),
+        mode,
+        where,
+        NUMBER_OF_DOCUMENTS,
+        SCORE_THRESHOLD,
+    )
+    version = _data_version()
+    with _query_cache_lock:
+        if version != _query_cache_version:
+            _query_cache.clear()
+            _query_cache_version = version
+        if key in _query_cache:
+            # Callers own what they get back, so hand out a fresh copy
+            return copy.deepcopy(_query_cache[key])
+
+    if mode == "lexical":
+        hits = _lexical_search(query, where)
+    elif mode == "hybrid":
+        vector_hits = _vector_search(query, where)
+        min_coverage = LEXICAL_MIN_COVERAGE if vector_hits else 1.0
+        hits = _fuse(vector_hits, _lexical_search(query, where, min_coverage))
+    else:
+        hits = _vector_search(query, where)
 
     # Format the results
     results = []
-    for i, doc in enumerate(relevant_docs, 1):
+    for i, (content, metadata) in enumerate(hits, 1):
         result = {
             "Document": i,
-            "Content": doc.page_content,
-            "Metadata": doc.metadata,
+            "Content": content,
+            "Metadata": display_metadata(metadata),
         }
         results.append(result)
 
+    with _query_cache_lock:
+        _query_cache[key] = copy.deepcopy(results)
     return results
 
 
 # Define the tool
 search_gmail_rag_tool = StructuredTool(
     name="search_gmail_rag_tool",
-    description="Query the Gmail-based vector store for relevant emails based on user questions.",
+    description=(
+        "Query the Gmail-based vector store for relevant emails based on user "
+        "questions, optionally restricted by labels, sender and date range."
+    ),
     func=query_gmail_vector_store,
     args_schema=GmailQueryInput,
 )
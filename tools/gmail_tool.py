@@ -1,39 +1,134 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional
+
 from langchain_core.tools import StructuredTool
-from pydantic import BaseModel
+from pydantic import Field
 
+from config import (GMAIL_HEDGE_DELAY, LIVE_SEARCH_DEADLINE,
+                    RAG_SEARCH_DEADLINE, RETRIEVAL_MODE)
 from logging_config import get_logger
-from tools.gmail_live_tool import search_gmail_service
-from tools.gmail_rag_tool import query_gmail_vector_store
+from services.email_metadata import MetadataFilter
+from tools.gmail_live_tool import search_gmail_live
+from tools.gmail_rag_tool import (EmailFilterInput, RetrievalMode,
+                                  check_retrieval_mode,
+                                  query_gmail_vector_store, warm_retrieval)
 
 logger = get_logger(__name__)
 
+# Branches that miss their deadline keep running in the background, so the
+# pool is sized for a few abandoned searches on top of the active ones
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gmail-search")
+
 
-class CombinedGmailSearchInput(BaseModel):
+class CombinedGmailSearchInput(EmailFilterInput):
     query: str  # Search query for Gmail (e.g., "label:inbox")
+    mode: RetrievalMode = Field(
+        RETRIEVAL_MODE,
+        description=(
+            "Retrieval mode for the stored emails: 'vector' for semantic "
+            "questions, 'lexical' for exact order numbers, PNRs, sender names or "
+            "phrases, 'hybrid' to combine both"
+        ),
+    )
+
+
+def _branch_result(future, name):
+    """Return a finished branch's results, treating errors as no results."""
+    try:
+        return future.result()
+    except Exception as e:
+        logger.error(f"{name} search failed: {e}")
+        return None
 
 
-def combined_gmail_search(query: str):
+def combined_gmail_search(
+    query: str,
+    mode: RetrievalMode = RETRIEVAL_MODE,
+    labels: Optional[List[str]] = None,
+    sender: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+):
     """
-    First search the Gmail RAG vector store. If no results are found,
-    fallback to the live Gmail search service.
+    Search the Gmail RAG vector store and hedge with a live Gmail search.
+
+    The live search starts if RAG has not produced results within
+    GMAIL_HEDGE_DELAY seconds. The first branch to return results wins and
+    the other is ignored; each branch is abandoned after its deadline.
+    Label, sender and date constraints are applied to both branches. The
+    stores are opened before the RAG deadline starts, and any error comes
+    back as an "Error" result instead of being raised.
     """
     try:
-        # Step 1: Query the RAG vector store
-        rag_results = query_gmail_vector_store(query)
+        return _hedged_search(query, mode, labels, sender, after, before)
+    except Exception as e:
+        logger.error(f"Error in combined Gmail search: {e}")
+        return {"source": "Error", "results": str(e)}
+
+
+def _hedged_search(query, mode, labels, sender, after, before):
+    check_retrieval_mode(mode)
+    where = MetadataFilter.from_query(labels, sender, after, before)
+    live_query = f"{query} {where.to_gmail_query()}".strip()
+
+    # Opened before the clock starts, so a cold store doesn't eat the deadline
+    try:
+        warm_retrieval(mode)
+    except Exception as e:
+        logger.error(f"Opening the RAG store failed: {e}")
+
+    start = time.monotonic()
+    rag_future = _executor.submit(
+        query_gmail_vector_store, query, mode, labels, sender, after, before
+    )
+    branches = {rag_future: ("RAG Vector Store", start + RAG_SEARCH_DEADLINE)}
 
+    done, _ = wait([rag_future], timeout=GMAIL_HEDGE_DELAY)
+    if done:
+        rag_results = _branch_result(rag_future, "RAG")
         if rag_results:
             logger.info("Found results in RAG vector store.")
             return {"source": "RAG Vector Store", "results": rag_results}
-
-        # Step 2: Fallback to live Gmail search if RAG has no results
         logger.info("No results in RAG vector store. Falling back to live search.")
-        live_results = search_gmail_service(query=query)
+        del branches[rag_future]
+    else:
+        logger.info("RAG search is slow. Starting live search in parallel.")
 
-        return {"source": "Live Gmail Search", "results": live_results}
+    live_future = _executor.submit(search_gmail_live, query=live_query)
+    branches[live_future] = (
+        "Live Gmail Search",
+        time.monotonic() + LIVE_SEARCH_DEADLINE,
+    )
 
-    except Exception as e:
-        logger.error(f"Error in combined Gmail search: {e}")
-        return {"source": "Error", "results": str(e)}
+    while branches:
+        now = time.monotonic()
+        for future, (source, deadline) in list(branches.items()):
+            if now >= deadline and not future.done():
+                logger.warning(f"{source} missed its deadline, ignoring it.")
+                future.cancel()
+                del branches[future]
+        if not branches:
+            break
+
+        timeout = min(deadline for _, deadline in branches.values()) - now
+        done, _ = wait(branches, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            source, _ = branches.pop(future)
+            results = _branch_result(future, source)
+            if results:
+                logger.info(f"Returning results from {source}.")
+                for pending in branches:
+                    pending.cancel()
+                return {"source": source, "results": results}
+
+    if (
+        live_future.done()
+        and not live_future.cancelled()
+        and live_future.exception() is None
+    ):
+        return {"source": "Live Gmail Search", "results": live_future.result()}
+    return {"source": "Error", "results": "Gmail search failed or timed out."}
 
 
 # Define the tool
@@ -41,7 +136,11 @@ search_gmail_combined_tool = StructuredTool(
     name="search_gmail_combined",
     description=(
         "Search Gmail for relevant emails. It first queries the Gmail RAG vector store. "
-        "If no results are found, it falls back to a live Gmail search."
+        "If no results are found, it falls back to a live Gmail search that "
+        "returns headers and snippets; use get_gmail_email_body with an email's "
+        "id to read its full body. Use labels, sender, after and before to "
+        "narrow the search, e.g. sender='amazon', after='1m' for last month's "
+        "orders."
     ),
     func=combined_gmail_search,
     args_schema=CombinedGmailSearchInput,
@@ -1,7 +1,7 @@
 from langchain_core.tools import StructuredTool
 from pydantic import BaseModel, Field
 
-from services.hashtag_generator import generate_hashtags
+from services.hashtag_generator import agenerate_hashtags, generate_hashtags
 
 
 class HashtagToolInput(BaseModel):
@@ -9,8 +9,9 @@ class HashtagToolInput(BaseModel):
 
 
 hashtag_tool = StructuredTool(
-    name="Hashtag Generator",
+    name="hashtag_generator",
     description="Generates some hashtags based on the text provided",
     func=generate_hashtags,
+    coroutine=agenerate_hashtags,
     args_schema=HashtagToolInput,
 )
@@ -1,7 +1,10 @@
+from typing import Dict, List, Optional
+
 from langchain_core.tools import StructuredTool
 from pydantic import BaseModel, Field
 
-from services.fetch_news import fetch_news_article
+from config import NEWS_DIGEST_PER_QUERY
+from services.fetch_news import fetch_news_digest, fetch_summarised_news
 
 
 class NewsToolInput(BaseModel):
@@ -16,9 +19,67 @@ class NewsToolInput(BaseModel):
     )
 
 
+def news_summary(
+    keyword: Optional[str] = None,
+    language: str = "en",
+    country: str = "US",
+) -> Dict[str, str]:
+    """Return the top article for a keyword, or a random topic, with a summary."""
+    try:
+        article = fetch_summarised_news(keyword, language, country)
+    except ValueError as e:
+        return {"error": str(e)}
+    return article.model_dump()
+
+
 news_tool = StructuredTool(
-    name="News Summarizer",
-    description="Fetches a news article (random or based on keyword), summarizes it",
-    func=fetch_news_article,
+    name="news_summarizer",
+    description=(
+        "Fetches a news article (random or based on keyword) and returns it "
+        "with a 60-word summary"
+    ),
+    func=news_summary,
     args_schema=NewsToolInput,
 )
+
+
+class NewsDigestInput(BaseModel):
+    keywords: Optional[List[str]] = Field(
+        None, description="Keywords to get news about, e.g. ['AI', 'cricket']"
+    )
+    topics: Optional[List[str]] = Field(
+        None, description="News topics such as WORLD, SCIENCE, ECONOMY or TRAVEL"
+    )
+    per_query: int = Field(
+        NEWS_DIGEST_PER_QUERY, description="Articles per keyword or topic"
+    )
+    language: str = Field(
+        "en", description="Language of the news articles (default is English)"
+    )
+    country: str = Field(
+        "US", description="Country code for news articles (default is US)"
+    )
+
+
+def news_digest(
+    keywords: Optional[List[str]] = None,
+    topics: Optional[List[str]] = None,
+    per_query: int = NEWS_DIGEST_PER_QUERY,
+    language: str = "en",
+    country: str = "US",
+) -> List[Dict[str, str]]:
+    """Return the summarized top articles for several keywords and topics."""
+    articles = fetch_news_digest(keywords, topics, per_query, language, country)
+    return [article.model_dump() for article in articles]
+
+
+news_digest_tool = StructuredTool(
+    name="news_digest",
+    description=(
+        "Fetches the top articles for several keywords or topics at once and "
+        "returns each with a 60-word summary. Use it for briefings such as "
+        "'morning news on AI, markets and science'."
+    ),
+    func=news_digest,
+    args_schema=NewsDigestInput,
+)